@@ -0,0 +1,191 @@
+import asyncio
+import os
+
+import httpx
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+# --- Configuration ---
+# Set one of these in every uvicorn worker to share a single model per host
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET") # e.g. /tmp/localreason-embeddings.sock
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL") # e.g. http://127.0.0.1:8765
+SERVICE_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2") # Must match rag_service.EMBEDDING_MODEL_NAME
+MAX_BATCH_SIZE = 128 # Texts per model.encode call, larger requests are split into pieces of this size
+MAX_REQUEST_TEXTS = 1024 # Texts per /embed call from the client, keeps each call well within CLIENT_TIMEOUT
+CLIENT_TIMEOUT = 60.0 # Seconds
+MAX_BATCH_WAIT = 0.005 # Seconds to wait for more requests before encoding a batch
+
+
+class MicroBatcher:
+    """
+    Collects texts from concurrent requests for up to MAX_BATCH_WAIT seconds (or until
+    MAX_BATCH_SIZE texts are queued) and embeds them with a single encode call.
+
+    Requests larger than MAX_BATCH_SIZE are queued one piece at a time, so a library being
+    indexed doesn't hold the model while chat queries wait behind it.
+    """
+
+    def __init__(self, encode, max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = MAX_BATCH_WAIT):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+    def start(self):
+        self.worker = asyncio.create_task(self._run())
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.max_batch_size):
+            # The next piece is queued behind whatever arrived while this one was encoded
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((texts[start:start + self.max_batch_size], future))
+            embeddings.extend(await future)
+        return embeddings
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            count = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+
+            while count < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            all_texts = [text for texts, _ in pending for text in texts]
+            try:
+                embeddings = await run_in_threadpool(self.encode, all_texts)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Hand each request back its own slice of the batch
+            offset = 0
+            for texts, future in pending:
+                if not future.done():
+                    future.set_result(embeddings[offset:offset + len(texts)])
+                offset += len(texts)
+
+
+# --- Service ---
+app = FastAPI()
+batcher = None
+
+
+@app.on_event("startup")
+async def on_startup():
+    global batcher
+    from sentence_transformers import SentenceTransformer # Only the service process loads the model
+
+    model = await run_in_threadpool(SentenceTransformer, SERVICE_MODEL_NAME)
+
+    def encode(texts: list[str]) -> list[list[float]]:
+        return model.encode(texts, batch_size=MAX_BATCH_SIZE, convert_to_numpy=True).tolist()
+
+    batcher = MicroBatcher(encode)
+    batcher.start()
+    print(f"Embedding service ready with model '{SERVICE_MODEL_NAME}'.")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "model": SERVICE_MODEL_NAME}
+
+
+@app.post("/embed")
+async def embed(request: Request):
+    data = await request.json()
+    texts = data.get("texts")
+    if not isinstance(texts, list):
+        raise HTTPException(status_code=400, detail="'texts' must be a list of strings.")
+    if not texts:
+        return {"model": SERVICE_MODEL_NAME, "embeddings": []}
+
+    embeddings = await batcher.embed(texts)
+    return {"model": SERVICE_MODEL_NAME, "embeddings": embeddings}
+
+
+# --- Client ---
+def embedding_service_configured() -> bool:
+    return bool(EMBEDDING_SERVICE_SOCKET or EMBEDDING_SERVICE_URL)
+
+
+class RemoteEmbeddingFunction(EmbeddingFunction):
+    """
+    ChromaDB embedding function that delegates to the shared embedding service.
+
+    It reports the same identity and config as SentenceTransformerEmbeddingFunction (the
+    service runs that model with the same defaults), so collections created with either
+    one can be reopened with the other.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        if EMBEDDING_SERVICE_SOCKET:
+            self.client = httpx.Client(
+                transport=httpx.HTTPTransport(uds=EMBEDDING_SERVICE_SOCKET),
+                base_url="http://embedding-service",
+                timeout=CLIENT_TIMEOUT,
+            )
+        else:
+            self.client = httpx.Client(base_url=EMBEDDING_SERVICE_URL, timeout=CLIENT_TIMEOUT)
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def default_space(self) -> str:
+        return "cosine"
+
+    def supported_spaces(self) -> list[str]:
+        return ["cosine", "l2", "ip"]
+
+    @staticmethod
+    def build_from_config(config: dict) -> "RemoteEmbeddingFunction":
+        return RemoteEmbeddingFunction(config["model_name"])
+
+    def get_config(self) -> dict:
+        # Mirrors SentenceTransformerEmbeddingFunction's defaults, which the service uses
+        return {
+            "model_name": self.model_name,
+            "device": "cpu",
+            "normalize_embeddings": False,
+            "kwargs": {},
+        }
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        embeddings = []
+        # Large inputs (whole libraries) are sent in several calls so none of them hits the timeout
+        for start in range(0, len(texts), MAX_REQUEST_TEXTS):
+            response = self.client.post("/embed", json={"texts": texts[start:start + MAX_REQUEST_TEXTS]})
+            response.raise_for_status()
+            data = response.json()
+            if data["model"] != self.model_name:
+                # Mixing models would silently corrupt the index
+                raise ValueError(f"Embedding service uses model '{data['model']}', expected '{self.model_name}'.")
+            embeddings.extend(data["embeddings"])
+        return embeddings
+
+
+# Usage: python embedding_service.py  (listens on EMBEDDING_SERVICE_SOCKET, or 127.0.0.1:8765)
+if __name__ == "__main__":
+    import uvicorn
+
+    if EMBEDDING_SERVICE_SOCKET:
+        uvicorn.run(app, uds=EMBEDDING_SERVICE_SOCKET)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("EMBEDDING_SERVICE_PORT", "8765")))
@@ -0,0 +1,311 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+
+import numpy as np
+
+from vector_store import LOAD_RETRIES, library_lock
+
+# --- Configuration ---
+BM25_K1 = 1.5
+BM25_B = 0.75
+TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+SUBWORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+BACKTICK_RE = re.compile(r"`([^`]+)`")
+IDENTIFIER_MAX_DOC_FREQ = 10 # Identifiers in more chunks than this are too common to answer lexically alone
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased word/identifier tokens. Compound identifiers are kept whole (for exact
+    lookups) and also split into their camelCase/snake_case parts (for natural language
+    queries), e.g. SPAStaticFiles -> spastaticfiles, spa, static, files.
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        word = match.group(0)
+        tokens.append(word.lower())
+        if word.isalpha() and (word[1:].islower() or word.isupper()):
+            continue # Plain word (hello, Hello, HTTP), nothing to split
+        parts = SUBWORD_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+def is_identifier(word: str) -> bool:
+    """
+    True for code-like tokens: snake_case, or camelCase/PascalCase with at least two humps
+    (getUserName, SPAStaticFiles). Single-hump words such as JavaScript, GitHub, iOS or
+    FastAPI are usually names in prose, not identifiers.
+    """
+    if "_" in word.strip("_"):
+        return True
+    mixed_case = any(c.isupper() for c in word[1:]) and any(c.islower() for c in word)
+    return mixed_case and len(SUBWORD_RE.findall(word)) >= 3
+
+
+def extract_identifiers(query: str) -> list[str]:
+    """Returns the (lowercased) identifiers a query names, including anything in backticks."""
+    identifiers = []
+    for quoted in BACKTICK_RE.findall(query):
+        identifiers.extend(word.lower() for word in TOKEN_RE.findall(quoted))
+    for word in TOKEN_RE.findall(query):
+        if is_identifier(word):
+            identifiers.append(word.lower())
+    return list(dict.fromkeys(identifiers))
+
+
+def index_documents(documents: list[str]) -> tuple[list[int], list[str], list[int], np.ndarray]:
+    """
+    Tokenizes a library's documents. Returns (doc_lens, terms, offsets, postings): postings
+    is an int32 (n, 2) array of (row, term frequency) pairs grouped by term, and term i's
+    pairs are postings[offsets[i]:offsets[i + 1]].
+    """
+    doc_lens = []
+    term_postings = {}
+    for row, document in enumerate(documents):
+        tokens = tokenize(document)
+        doc_lens.append(len(tokens))
+        for token, tf in Counter(tokens).items():
+            term_postings.setdefault(token, []).extend((row, tf))
+
+    terms = list(term_postings)
+    offsets = [0]
+    for term in terms:
+        offsets.append(offsets[-1] + len(term_postings[term]) // 2)
+    flat = [value for term in terms for value in term_postings[term]]
+    postings = np.array(flat, dtype=np.int32).reshape(-1, 2)
+    return doc_lens, terms, offsets, postings
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over library chunks, kept alongside the vector store.
+
+    Libraries are tokenized at write time. Files per library in `path`:
+      lib_{id}.json                   chunk ids, documents, metadatas, doc lengths, terms and the current version
+      lib_{id}.{version}.postings.npy (row, tf) pairs grouped by term, memory-mapped on load
+      lib_{id}.lock                   flock'ed by writers so workers don't interleave updates
+    The JSON is replaced atomically last. Workers load a library the first time it is
+    searched and reload it when the JSON changes, so they stay in sync with each other.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cache = {} # library_id -> (json file signature, loaded library)
+        self.write_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _library_path(self, library_id: int) -> str:
+        return os.path.join(self.path, f"lib_{library_id}.json")
+
+    def _postings_path(self, library_id: int, version: str) -> str:
+        return os.path.join(self.path, f"lib_{library_id}.{version}.postings.npy")
+
+    def _load(self, library_id: int) -> dict | None:
+        library_path = self._library_path(library_id)
+        for attempt in range(LOAD_RETRIES):
+            try:
+                stat = os.stat(library_path)
+            except FileNotFoundError:
+                self.cache.pop(library_id, None)
+                return None
+
+            signature = (stat.st_ino, stat.st_mtime_ns)
+            cached = self.cache.get(library_id)
+            if cached and cached[0] == signature:
+                return cached[1]
+
+            try:
+                with open(library_path, "r") as f:
+                    data = json.load(f)
+                if "version" in data:
+                    doc_lens, terms, offsets = data["doc_lens"], data["terms"], data["offsets"]
+                    postings = np.load(self._postings_path(library_id, data["version"]), mmap_mode="r")
+                else:
+                    # Written before postings were persisted, index it once here
+                    doc_lens, terms, offsets, postings = index_documents(data["documents"])
+                break
+            except FileNotFoundError:
+                # Replaced (or deleted) by another writer since the stat, re-read the new JSON
+                if attempt == LOAD_RETRIES - 1:
+                    raise
+
+        library = {
+            "version": data.get("version"),
+            "ids": data["ids"],
+            "documents": data["documents"],
+            "metadatas": data["metadatas"],
+            "doc_lens": doc_lens,
+            "total_len": sum(doc_lens),
+            "terms": {term: i for i, term in enumerate(terms)},
+            "offsets": offsets,
+            "postings": postings,
+            "term_rows": {}, # term -> {row: tf}, built from postings on first use
+        }
+        self.cache[library_id] = (signature, library)
+        return library
+
+    def _remove_postings(self, library_id: int, version: str | None):
+        if version is None:
+            return
+        try:
+            os.remove(self._postings_path(library_id, version))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _library_doc_freq(library: dict, term: str) -> int:
+        i = library["terms"].get(term)
+        return 0 if i is None else library["offsets"][i + 1] - library["offsets"][i]
+
+    @staticmethod
+    def _term_rows(library: dict, term: str) -> dict[int, int]:
+        """{row: term frequency} for term in a loaded library."""
+        term_rows = library["term_rows"].get(term)
+        if term_rows is None:
+            i = library["terms"].get(term)
+            if i is None:
+                return {}
+            pairs = library["postings"][library["offsets"][i]:library["offsets"][i + 1]]
+            term_rows = library["term_rows"][term] = dict(pairs.tolist())
+        return term_rows
+
+    def document_frequency(self, term: str, library_ids: list[int]) -> int:
+        """Number of chunks in the selected libraries containing term."""
+        return sum(self._library_doc_freq(library, term) for library in (self._load(library_id) for library_id in library_ids) if library)
+
+    def rare_identifiers(self, query: str, library_ids: list[int]) -> list[str]:
+        """Identifiers named in the query that occur in a few (but at least one) selected chunks."""
+        return [
+            identifier for identifier in extract_identifiers(query)
+            if 0 < self.document_frequency(identifier, library_ids) <= IDENTIFIER_MAX_DOC_FREQ
+        ]
+
+    def add(self, ids: list[str], documents: list[str], metadatas: list[dict]):
+        """Adds or replaces chunks, grouped by their library_id metadata."""
+        by_library = {}
+        for i, metadata in enumerate(metadatas):
+            by_library.setdefault(metadata["library_id"], []).append(i)
+
+        for library_id, rows in by_library.items():
+            with library_lock(self.path, library_id, self.write_lock):
+                merged = {}
+                existing = self._load(library_id)
+                if existing:
+                    for i, chunk_id in enumerate(existing["ids"]):
+                        merged[chunk_id] = (existing["documents"][i], existing["metadatas"][i])
+                for i in rows:
+                    merged[ids[i]] = (documents[i], metadatas[i])
+
+                ordered = sorted(merged.items(), key=lambda item: item[1][1].get("chunk_index", 0))
+                library_documents = [document for _, (document, _) in ordered]
+                doc_lens, terms, offsets, postings = index_documents(library_documents)
+
+                version = uuid.uuid4().hex[:12]
+                np.save(self._postings_path(library_id, version), postings)
+                # Unique per write, so a concurrent writer (e.g. where flock is unavailable) can't rename it away
+                tmp_path = f"{self._library_path(library_id)}.{version}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({
+                        "version": version,
+                        "ids": [chunk_id for chunk_id, _ in ordered],
+                        "documents": library_documents,
+                        "metadatas": [metadata for _, (_, metadata) in ordered],
+                        "doc_lens": doc_lens,
+                        "terms": terms,
+                        "offsets": offsets,
+                    }, f)
+                os.replace(tmp_path, self._library_path(library_id))
+
+                if existing:
+                    self._remove_postings(library_id, existing["version"])
+
+    def delete_library(self, library_id: int):
+        with library_lock(self.path, library_id, self.write_lock):
+            existing = self._load(library_id)
+            try:
+                os.remove(self._library_path(library_id))
+            except FileNotFoundError:
+                pass
+            if existing:
+                self._remove_postings(library_id, existing["version"])
+            self.cache.pop(library_id, None)
+
+    def search(self, query: str, library_ids: list[int], k: int, required_terms: list[str] | None = None) -> dict:
+        """
+        Top k chunks by BM25 over the selected libraries. With required_terms, only chunks
+        containing at least one of them are candidates, and only those rows are scored (so
+        common query words cost a dict lookup per candidate, not a posting list walk). Returns
+        parallel lists of ids, documents, metadatas and scores (higher is better).
+        """
+        results = {"ids": [], "documents": [], "metadatas": [], "scores": []}
+        libraries = [library for library in (self._load(library_id) for library_id in library_ids) if library and library["ids"]]
+        if not libraries:
+            return results
+
+        # Corpus statistics over the selected libraries only
+        total_docs = sum(len(library["ids"]) for library in libraries)
+        avg_doc_len = (sum(library["total_len"] for library in libraries) / total_docs) or 1.0
+
+        idfs = {}
+        for term in set(tokenize(query)):
+            doc_freq = sum(self._library_doc_freq(library, term) for library in libraries)
+            if doc_freq:
+                idfs[term] = math.log(1 + (total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+        def term_score(library: dict, row: int, tf: int, idf: float) -> float:
+            doc_len_norm = 1 - BM25_B + BM25_B * library["doc_lens"][row] / avg_doc_len
+            return idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * doc_len_norm)
+
+        scores = {}
+        for library_index, library in enumerate(libraries):
+            if required_terms:
+                # Score the few candidate rows directly instead of walking every posting list
+                candidates = set()
+                for term in required_terms:
+                    candidates.update(self._term_rows(library, term))
+                for row in candidates:
+                    score = 0.0
+                    for term, idf in idfs.items():
+                        tf = self._term_rows(library, term).get(row)
+                        if tf:
+                            score += term_score(library, row, tf, idf)
+                    scores[(library_index, row)] = score
+            else:
+                for term, idf in idfs.items():
+                    for row, tf in self._term_rows(library, term).items():
+                        key = (library_index, row)
+                        scores[key] = scores.get(key, 0.0) + term_score(library, row, tf, idf)
+
+        for (library_index, row), score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            library = libraries[library_index]
+            results["ids"].append(library["ids"][row])
+            results["documents"].append(library["documents"][row])
+            results["metadatas"].append(library["metadatas"][row])
+            results["scores"].append(score)
+        return results
+
+
+def reciprocal_rank_fusion(result_lists: list[dict], k: int, rrf_k: int = 60) -> dict:
+    """Merges ranked result dicts (ids/documents/metadatas) by reciprocal rank fusion."""
+    fused = {}
+    for results in result_lists:
+        for rank, chunk_id in enumerate(results["ids"]):
+            if chunk_id not in fused:
+                fused[chunk_id] = [0.0, results["documents"][rank], results["metadatas"][rank]]
+            fused[chunk_id][0] += 1.0 / (rrf_k + rank + 1)
+
+    top = heapq.nlargest(k, fused.items(), key=lambda item: item[1][0])
+    return {
+        "ids": [chunk_id for chunk_id, _ in top],
+        "documents": [document for _, (_, document, _) in top],
+        "metadatas": [metadata for _, (_, _, metadata) in top],
+        "scores": [score for _, (score, _, _) in top],
+    }
@@ -0,0 +1,76 @@
+import asyncio
+import inspect
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+
+class Stage:
+    """
+    A named step of a pipeline.
+
+    `run` receives the pipeline context (the request inputs plus the outputs of every
+    finished stage, keyed by stage name) and its return value is stored under `name`.
+    Stages listed in `after` must finish first. Synchronous functions (SQLite, ChromaDB)
+    are run in the threadpool so they don't block other stages or the event loop.
+    """
+
+    def __init__(self, name: str, run, after: tuple[str, ...] = ()):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+
+
+class Pipeline:
+    """
+    A DAG of stages. Every stage starts as soon as the stages it depends on are done,
+    so independent branches (e.g. a thinking pass and retrieval) run concurrently and
+    latency is the critical path rather than the sum of all steps.
+    """
+
+    def __init__(self, name: str, stages: list[Stage]):
+        self.name = name
+        self.stages = stages
+
+        # Stages must be declared after their dependencies, which also rules out cycles
+        seen = set()
+        for stage in stages:
+            if stage.name in seen:
+                raise ValueError(f"Pipeline '{name}': duplicate stage '{stage.name}'.")
+            for dependency in stage.after:
+                if dependency not in seen:
+                    raise ValueError(f"Pipeline '{name}': stage '{stage.name}' depends on unknown or later stage '{dependency}'.")
+            seen.add(stage.name)
+
+    async def _run_stage(self, stage: Stage, context: dict, tasks: dict):
+        if stage.after:
+            await asyncio.gather(*(tasks[dependency] for dependency in stage.after))
+
+        started = time.perf_counter()
+        if inspect.iscoroutinefunction(stage.run):
+            result = await stage.run(context)
+        else:
+            result = await run_in_threadpool(stage.run, context)
+        context[stage.name] = result
+        print(f"[{self.name}] stage '{stage.name}' finished in {time.perf_counter() - started:.2f}s")
+
+    async def run(self, **inputs) -> dict:
+        """Runs every stage and returns the final context."""
+        context = dict(inputs)
+        tasks = {}
+        started = time.perf_counter()
+
+        for stage in self.stages:
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, context, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            # One stage failed (or the request was cancelled): stop the rest before propagating
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        print(f"[{self.name}] pipeline finished in {time.perf_counter() - started:.2f}s")
+        return context
@@ -1,10 +1,21 @@
+import os
 import chromadb
 from chromadb.utils import embedding_functions
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from database import Library # Assuming Library model is accessible
+from embedding_service import RemoteEmbeddingFunction, embedding_service_configured
+from vector_store import ChromaVectorStore, NumpyVectorStore
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
 
 # --- Configuration ---
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma") # "chroma" or "numpy"
+NUMPY_INDEX_PATH = "./vector_index"
+NUMPY_INDEX_DTYPE = os.getenv("NUMPY_INDEX_DTYPE", "float16") # "float16" or "int8"
+LEXICAL_INDEX_PATH = "./lexical_index"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid") # "hybrid" (BM25 + vectors) or "vector"
 CHROMA_DB_PATH = "./chroma_db"
+CHROMA_HOST = os.getenv("CHROMA_HOST") # Set to share one Chroma server between workers instead of a local PersistentClient
+CHROMA_PORT = os.getenv("CHROMA_PORT") # Required with CHROMA_HOST, no default since the app itself runs on 8000
 COLLECTION_NAME = "library_docs"
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 CHUNK_SIZE = 1000 # Characters per chunk
@@ -12,21 +23,41 @@ CHUNK_OVERLAP = 150 # Overlap between chunks
 
 # --- Initialization ---
 try:
-    # Initialize ChromaDB client (persistent) - Reverting to this simpler method
-    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    client = None
+    collection = None
 
-    # Initialize Sentence Transformer embedding function
-    # Langchain integration might be cleaner, but this works directly with ChromaDB
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=EMBEDDING_MODEL_NAME
-    )
+    if embedding_service_configured():
+        # Shared out-of-process model: one copy per host, concurrent requests are micro-batched
+        embedding_function = RemoteEmbeddingFunction(EMBEDDING_MODEL_NAME)
+    else:
+        # Initialize Sentence Transformer embedding function
+        # Langchain integration might be cleaner, but this works directly with ChromaDB
+        embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+            model_name=EMBEDDING_MODEL_NAME
+        )
 
-    # Get or create the collection with the specified embedding function
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        embedding_function=sentence_transformer_ef,
-        metadata={"hnsw:space": "cosine"} # Use cosine distance for similarity
-    )
+    if VECTOR_STORE_BACKEND == "numpy":
+        # Per-library memory-mapped matrices, only the selected libraries are searched
+        vector_store = NumpyVectorStore(NUMPY_INDEX_PATH, embedding_function, dtype=NUMPY_INDEX_DTYPE)
+    else:
+        if CHROMA_HOST:
+            if not CHROMA_PORT:
+                raise RuntimeError("CHROMA_PORT must be set when CHROMA_HOST is set.")
+            client = chromadb.HttpClient(host=CHROMA_HOST, port=int(CHROMA_PORT))
+        else:
+            # Initialize ChromaDB client (persistent) - Reverting to this simpler method
+            client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+
+        # Get or create the collection with the specified embedding function
+        collection = client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            embedding_function=embedding_function,
+            metadata={"hnsw:space": "cosine"} # Use cosine distance for similarity
+        )
+        vector_store = ChromaVectorStore(collection)
+
+    # BM25 index over the same chunks, used for identifier lookups and hybrid ranking
+    lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
 
     # Initialize Langchain text splitter
     text_splitter = RecursiveCharacterTextSplitter(
@@ -35,7 +66,10 @@ try:
         length_function=len,
     )
 
-    print(f"ChromaDB collection '{COLLECTION_NAME}' initialized successfully at {CHROMA_DB_PATH}.")
+    if collection:
+        print(f"ChromaDB collection '{COLLECTION_NAME}' initialized successfully at {CHROMA_HOST or CHROMA_DB_PATH}.")
+    else:
+        print(f"NumPy vector index ({NUMPY_INDEX_DTYPE}) initialized successfully at {NUMPY_INDEX_PATH}.")
 
 except Exception as e:
     print(f"!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
@@ -47,13 +81,15 @@ except Exception as e:
     # Set components to None to prevent further errors and indicate failure
     client = None
     collection = None
+    vector_store = None
+    lexical_index = None
     text_splitter = None
 
 # --- Core Functions ---
 
 def add_or_update_library(library: Library):
-    """Chunks, embeds, and stores/updates a library's content in ChromaDB."""
-    if not collection or not text_splitter:
+    """Chunks, embeds, and stores/updates a library's content in the vector store."""
+    if not vector_store or not text_splitter:
         print("RAG service not initialized. Skipping indexing.")
         return
 
@@ -65,12 +101,18 @@ def add_or_update_library(library: Library):
 
     # 1. Delete existing chunks for this library ID to ensure clean update
     try:
-        collection.delete(where={"library_id": library.id})
+        vector_store.delete_library(library.id)
         print(f"Deleted existing chunks for library ID: {library.id}")
     except Exception as e:
         # Might fail if no chunks exist, which is okay
         print(f"Note: Could not delete existing chunks for library ID {library.id} (may not exist): {e}")
 
+    if lexical_index:
+        try:
+            lexical_index.delete_library(library.id)
+        except Exception as e:
+            print(f"Note: Could not delete existing lexical index entries for library ID {library.id}: {e}")
+
 
     # 2. Chunk the text
     chunks = text_splitter.split_text(library.content)
@@ -80,26 +122,29 @@ def add_or_update_library(library: Library):
         print(f"No chunks generated for library ID: {library.id}. Skipping storage.")
         return
 
-    # 3. Prepare data for ChromaDB
+    # 3. Prepare data for the vector store
     ids = [f"lib_{library.id}_chunk_{i}" for i in range(len(chunks))]
     metadatas = [{"library_id": library.id, "chunk_index": i, "library_name": library.name} for i in range(len(chunks))]
     documents = chunks # The actual text chunks
 
-    # 4. Add to ChromaDB (handles embedding automatically via collection's embedding_function)
+    # 4. Add to the vector store (handles embedding automatically via the embedding_function)
     try:
-        collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
-        )
+        vector_store.add(ids, documents, metadatas)
         print(f"Successfully added/updated {len(chunks)} chunks for library ID: {library.id}")
     except Exception as e:
-        print(f"Error adding chunks to ChromaDB for library ID {library.id}: {e}")
+        print(f"Error adding chunks to vector store for library ID {library.id}: {e}")
+
+    # 5. Add to the lexical index (independent of the vector store, one failing doesn't skip the other)
+    if lexical_index:
+        try:
+            lexical_index.add(ids, documents, metadatas)
+        except Exception as e:
+            print(f"Error adding chunks to lexical index for library ID {library.id}: {e}")
 
 
 def delete_library(library_id: int):
-    """Deletes all chunks associated with a library_id from ChromaDB."""
-    if not collection:
+    """Deletes all chunks associated with a library_id from the vector store."""
+    if not vector_store:
         print("RAG service not initialized. Skipping deletion.")
         return
 
@@ -109,16 +154,45 @@ def delete_library(library_id: int):
 
     try:
         print(f"Attempting to delete chunks for library ID: {library_id}")
-        # Use 'where' filter to target specific library ID
-        collection.delete(where={"library_id": library_id})
+        vector_store.delete_library(library_id)
         print(f"Successfully deleted chunks for library ID: {library_id}")
     except Exception as e:
-        print(f"Error deleting chunks from ChromaDB for library ID {library_id}: {e}")
+        print(f"Error deleting chunks from vector store for library ID {library_id}: {e}")
+
+    if lexical_index:
+        try:
+            lexical_index.delete_library(library_id)
+        except Exception as e:
+            print(f"Error deleting chunks from lexical index for library ID {library_id}: {e}")
+
+
+def search_chunks(query: str, selected_library_ids: list[int], k: int) -> dict:
+    """
+    Top k chunks as a dict of parallel lists (ids, documents, metadatas).
+
+    In hybrid mode, queries naming code identifiers (e.g. SPAStaticFiles, add_or_update_library
+    or anything in backticks) that are rare in the selected libraries are answered from the
+    BM25 index alone, skipping the query embedding. All other queries fuse BM25 and vector
+    rankings with reciprocal rank fusion.
+    """
+    if RETRIEVAL_MODE != "hybrid" or not lexical_index:
+        return vector_store.query(query, selected_library_ids, k)
+
+    identifiers = lexical_index.rare_identifiers(query, selected_library_ids)
+    if identifiers:
+        identifier_hits = lexical_index.search(query, selected_library_ids, k, required_terms=identifiers)
+        if identifier_hits["ids"]:
+            print(f"Answered from lexical index (identifiers: {identifiers}).")
+            return identifier_hits
+
+    vector_results = vector_store.query(query, selected_library_ids, k)
+    lexical_results = lexical_index.search(query, selected_library_ids, k)
+    return reciprocal_rank_fusion([vector_results, lexical_results], k)
 
 
 def retrieve_relevant_chunks(query: str, selected_library_ids: list[int], k: int = 10) -> list[str]: # Increased default k to 10
     """Retrieves the top k relevant chunks for a query, filtered by selected libraries."""
-    if not collection:
+    if not vector_store:
         print("RAG service not initialized. Returning empty list.")
         return []
 
@@ -128,109 +202,90 @@ def retrieve_relevant_chunks(query: str, selected_library_ids: list[int], k: int
 
     print(f"Retrieving top {k} chunks for query, filtered by library IDs: {selected_library_ids}")
 
-    # Construct the 'where' filter for ChromaDB
-    # Needs to match any of the selected library IDs
-    where_filter = {"library_id": {"$in": selected_library_ids}}
-
     try:
-        results = collection.query(
-            query_texts=[query],
-            n_results=k,
-            where=where_filter,
-            include=['documents'] # Only need the document text
-        )
-
-        # Extract the document texts from the results
-        # Results is a dict, 'documents' is a list containing one list (for the one query)
-        retrieved_docs = results.get('documents', [[]])[0]
+        results = search_chunks(query, selected_library_ids, k)
+        retrieved_docs = results["documents"]
 
         print(f"Retrieved {len(retrieved_docs)} chunks.")
         return retrieved_docs
 
     except Exception as e:
-        print(f"Error querying ChromaDB: {e}")
+        print(f"Error querying vector store: {e}")
         return []
 
 
-# New function to retrieve surrounding chunks
-def retrieve_relevant_chunks_surrounding(query: str, selected_library_ids: list[int], k: int = 10) -> list[str]:
-    """
-    Retrieves the top k relevant chunks and their immediate surrounding chunks
-    (previous and next based on index) for a query, filtered by selected libraries.
-    """
-    if not collection:
+# Step 1 of surrounding retrieval: top k hits with the metadata needed to locate neighbours
+def retrieve_chunk_hits(query: str, selected_library_ids: list[int], k: int = 10) -> tuple[list[str], list[dict]]:
+    """Retrieves the IDs and metadata of the top k relevant chunks, filtered by selected libraries."""
+    if not vector_store:
         print("RAG service not initialized. Returning empty list.")
-        return []
+        return [], []
 
     if not selected_library_ids:
         print("No libraries selected for retrieval. Returning empty list.")
-        return []
+        return [], []
 
     print(f"Retrieving top {k} chunks and their neighbours for query, filtered by library IDs: {selected_library_ids}")
 
-    # Construct the 'where' filter for ChromaDB
-    where_filter = {"library_id": {"$in": selected_library_ids}}
-
     try:
-        # Step 1: Query for Top K with Metadata
-        initial_results = collection.query(
-            query_texts=[query],
-            n_results=k,
-            where=where_filter,
-            include=['metadatas'] # Only need metadata initially to find neighbours
-        )
-
-        # Step 2: Identify Target Chunks (Original + Surrounding)
-        target_ids_to_fetch = set()
-        initial_results_ids = initial_results.get('ids', [[]])[0]
-        initial_results_metadatas = initial_results.get('metadatas', [[]])[0]
+        initial_results = search_chunks(query, selected_library_ids, k)
+        initial_results_ids = initial_results["ids"]
+        initial_results_metadatas = initial_results["metadatas"]
 
         if not initial_results_ids or not initial_results_metadatas:
              print("Initial query returned no results.")
-             return []
+             return [], []
+
+        print(f"Retrieved {len(initial_results_ids)} initial chunks.")
+        return initial_results_ids, initial_results_metadatas
 
-        print(f"Retrieved {len(initial_results_ids)} initial chunks. Identifying surrounding chunks...")
+    except Exception as e:
+        print(f"Error during surrounding chunk retrieval: {e}")
+        return [], []
 
-        for i, chunk_id in enumerate(initial_results_ids):
-            metadata = initial_results_metadatas[i]
-            if not metadata:
-                print(f"Warning: Missing metadata for chunk ID {chunk_id}. Skipping surrounding chunk fetch for this.")
-                target_ids_to_fetch.add(chunk_id)
-                continue
 
-            library_id = metadata.get('library_id')
-            chunk_index = metadata.get('chunk_index')
+# Step 2 of surrounding retrieval: fetch the hits plus their previous/next chunks
+def expand_neighbouring_chunks(chunk_ids: list[str], metadatas: list[dict]) -> list[str]:
+    """Fetches the given chunks and their immediate neighbours (previous and next based on index)."""
+    if not vector_store or not chunk_ids:
+        return []
 
-            if library_id is None or chunk_index is None:
-                print(f"Warning: Incomplete metadata ({metadata}) for chunk ID {chunk_id}. Skipping surrounding chunk fetch.")
-                target_ids_to_fetch.add(chunk_id)
-                continue
+    print("Identifying surrounding chunks...")
 
-            # Add the initially retrieved chunk ID
+    # Identify Target Chunks (Original + Surrounding)
+    target_ids_to_fetch = set()
+    for i, chunk_id in enumerate(chunk_ids):
+        metadata = metadatas[i]
+        if not metadata:
+            print(f"Warning: Missing metadata for chunk ID {chunk_id}. Skipping surrounding chunk fetch for this.")
             target_ids_to_fetch.add(chunk_id)
+            continue
 
-            # Add preceding chunk ID if index > 0
-            if chunk_index > 0:
-                prev_chunk_id = f"lib_{library_id}_chunk_{chunk_index - 1}"
-                target_ids_to_fetch.add(prev_chunk_id)
+        library_id = metadata.get('library_id')
+        chunk_index = metadata.get('chunk_index')
 
-            # Add succeeding chunk ID optimistically
-            next_chunk_id = f"lib_{library_id}_chunk_{chunk_index + 1}"
-            target_ids_to_fetch.add(next_chunk_id)
+        if library_id is None or chunk_index is None:
+            print(f"Warning: Incomplete metadata ({metadata}) for chunk ID {chunk_id}. Skipping surrounding chunk fetch.")
+            target_ids_to_fetch.add(chunk_id)
+            continue
 
-        print(f"Total unique target chunks (initial + surrounding): {len(target_ids_to_fetch)}")
+        # Add the initially retrieved chunk ID
+        target_ids_to_fetch.add(chunk_id)
 
-        # Step 3: Fetch All Target Chunks by ID
-        if not target_ids_to_fetch:
-             return []
+        # Add preceding chunk ID if index > 0
+        if chunk_index > 0:
+            prev_chunk_id = f"lib_{library_id}_chunk_{chunk_index - 1}"
+            target_ids_to_fetch.add(prev_chunk_id)
 
-        final_results = collection.get(
-            ids=list(target_ids_to_fetch),
-            include=['documents']
-        )
+        # Add succeeding chunk ID optimistically
+        next_chunk_id = f"lib_{library_id}_chunk_{chunk_index + 1}"
+        target_ids_to_fetch.add(next_chunk_id)
+
+    print(f"Total unique target chunks (initial + surrounding): {len(target_ids_to_fetch)}")
 
-        # Step 4: Return Documents
-        retrieved_docs = final_results.get('documents', [])
+    try:
+        # Fetch All Target Chunks by ID
+        retrieved_docs = vector_store.get(list(target_ids_to_fetch))
 
         print(f"Retrieved {len(retrieved_docs)} final chunks (including surrounding).")
         # Note: The order might not be sequential, but contains the relevant + surrounding context.
@@ -239,3 +294,13 @@ def retrieve_relevant_chunks_surrounding(query: str, selected_library_ids: list[
     except Exception as e:
         print(f"Error during surrounding chunk retrieval: {e}")
         return []
+
+
+# New function to retrieve surrounding chunks
+def retrieve_relevant_chunks_surrounding(query: str, selected_library_ids: list[int], k: int = 10) -> list[str]:
+    """
+    Retrieves the top k relevant chunks and their immediate surrounding chunks
+    (previous and next based on index) for a query, filtered by selected libraries.
+    """
+    chunk_ids, metadatas = retrieve_chunk_hits(query, selected_library_ids, k)
+    return expand_neighbouring_chunks(chunk_ids, metadatas)
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, HTTPException, Request
-from fastapi import APIRouter, HTTPException, Request
 import httpx
 import json
 import os
 # Import RAG retrieval functions and library loading function
-from rag_service import retrieve_relevant_chunks, retrieve_relevant_chunks_surrounding # Import both
+from rag_service import retrieve_chunk_hits, expand_neighbouring_chunks
 from database import get_libraries # Re-added for chat-ver2
+from pipeline_engine import Pipeline, Stage
 
 chat_router = APIRouter()
 
@@ -44,6 +44,14 @@ async def read_rag_direct_prompt():
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail="RAG direct prompt file (config/rag-direct-prompt.txt) not found.")
 
+# Reads the library-free chain-of-thought prompt (preprompt-2)
+async def read_preprompt_2():
+    try:
+        with open("config/preprompt-2.txt", "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Config file preprompt-2.txt not found.")
+
 # Reads the specific prompt file for preprompt-3
 async def read_preprompt_3():
     try:
@@ -76,248 +84,220 @@ async def generate_llm_response(prompt, model=DEFAULT_MODEL):
         return response_data["response"]
 
 
-# New Plain Chat Endpoint
-@chat_router.post("/chat")
-async def plain_chat_handler(request: Request):
-    try:
-        data = await request.json()
-        user_prompt = data.get("prompt")
-        selected_model = data.get("model", DEFAULT_MODEL)
+NO_LIBRARIES_MESSAGE = "No libraries were selected for analysis."
+NO_DOCS_MESSAGE = "No relevant documentation found in the selected libraries."
 
-        if not user_prompt:
-            raise HTTPException(status_code=400, detail="Prompt is required.")
 
-        # Read the specific preprompt for this endpoint
-        plain_preprompt_template = await read_plain_preprompt()
+# --- Pipeline Stages ---
+# Each stage takes the pipeline context: the request inputs ("prompt", "model",
+# "selected_libraries") plus the output of every finished stage, keyed by stage name.
 
-        # Construct the prompt using the plain template
-        full_prompt = plain_preprompt_template.replace("[INSERT QUESTION]", user_prompt)
+async def load_plain_config(ctx):
+    return await read_plain_preprompt()
 
-        print("------ Plain Chat Prompt -------")
-        print(full_prompt)
+async def load_rag_config(ctx):
+    return await read_rag_config_files() # (preprompt, endoff, retrieval prompt)
 
-        # Generate response using the LLM
-        llm_response = await generate_llm_response(full_prompt, selected_model)
+def retrieve(ctx):
+    # Top k chunk IDs + metadata; blocking ChromaDB call, runs in the threadpool
+    if not ctx["selected_libraries"]:
+        return [], []
+    return retrieve_chunk_hits(ctx["prompt"], ctx["selected_libraries"])
 
-        return {"response": llm_response}
+def expand_neighbors(ctx):
+    chunk_ids, metadatas = ctx["retrieve"]
+    return expand_neighbouring_chunks(chunk_ids, metadatas)
 
-    except HTTPException as e:
-        # Re-raise HTTPExceptions directly
-        raise e
-    except Exception as e:
-        print(f"Unhandled error in plain chat handler: {e}")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+def load_libraries(ctx):
+    # Full library content from SQLite (used by /chat-pipeline instead of RAG)
+    if not ctx["selected_libraries"]:
+        return []
+    return get_libraries(ctx["selected_libraries"])
 
+async def think(ctx):
+    # Library-free chain-of-thought pass, independent of retrieval
+    thinking_prompt = (await read_preprompt_2()).replace("[INSERT QUESTION]", ctx["prompt"])
 
-# RAG Chat Endpoint (Modified to use specific config reader)
-@chat_router.post("/chat-rag")
-async def chat_rag_handler(request: Request): # Renamed handler function
-    try:
-        data = await request.json()
-        user_prompt = data.get("prompt")
-        selected_model = data.get("model", DEFAULT_MODEL)
-        
-        if not user_prompt:
-            raise HTTPException(status_code=400, detail="Prompt is required.")
-        
-        # Get selected libraries
-        selected_libraries = data.get("selected_libraries", []) # Expecting a list of integers (IDs)
-
-        # Read config files needed (retrieval prompt for stage 1, preprompt-3 for stage 2)
-        preprompt, _, retrieval_prompt = await read_rag_config_files() # Need retrieval prompt
-
-        condensed_context = None # Initialize
-
-        if selected_libraries:
-            # Libraries selected, perform RAG retrieval
-            print("------ Performing RAG retrieval (with surrounding) (/chat-rag) -------")
-            retrieved_docs = retrieve_relevant_chunks_surrounding(user_prompt, selected_libraries)
-            raw_retrieved_context = "\n\n---\n\n".join(retrieved_docs)
-
-            if not retrieved_docs:
-                 raw_retrieved_context = "No relevant documentation found in the selected libraries."
-                 condensed_context = raw_retrieved_context # Use the 'not found' message directly
-                 print("------ Condensation Skipped (No Docs Found) (/chat-rag) -------")
-            else:
-                # STAGE 1 (Condensation): Use retrieval prompt on RAG results
-                condensation_prompt = retrieval_prompt.replace("[INSERT QUESTION]", user_prompt).replace("[DOCUMENTATION_TEXT]", raw_retrieved_context)
-
-                print("------ Condensation Prompt (/chat-rag) -------")
-                print(condensation_prompt)
-
-                # LLM call to condense/analyze the RAG context
-                condensed_context = await generate_llm_response(condensation_prompt, selected_model)
-
-                print("------ Condensed Context (/chat-rag) -------")
-                print(condensed_context)
-        else:
-            # No libraries selected, skip RAG and Condensation
-            condensed_context = "No libraries were selected for analysis."
-            print("------ RAG and Condensation Skipped (No Libraries Selected) (/chat-rag) -------")
-
-        # STAGE 2: Use the condensed context and preprompt-3 for final response generation attempt
-        # NOTE: preprompt-3 is designed for analysis, not final answer generation, results may vary.
-        stage2_prompt = f"## Relevant Documentation Context (Analyzed):\n{condensed_context}\n\n--- End of Analyzed Context ---\n\n{preprompt.replace('[INSERT QUESTION]', user_prompt)}"
-
-        print("------ Stage 2 Prompt (using preprompt-3) (/chat-rag) -------")
-        print(stage2_prompt)
-
-        # Final LLM call to generate the response
-        final_response = await generate_llm_response(stage2_prompt, selected_model)
-
-        # Attempt to extract just the final answer part if preprompt-3 structure is followed
-        # This is brittle and depends on the LLM adhering to the structure.
-        try:
-            # Look for the synthesis part, assuming it's the closest to a final answer
-            answer_part = final_response.split("## Step 3: Final Synthesis & Strategy")[1]
-            answer_part = answer_part.split("---")[0].strip() # Get content before the next separator
-        except IndexError:
-            # If the structure isn't found, return the whole response
-            answer_part = final_response
-
-        return {
-            "response": answer_part, # Return the potentially extracted answer
-            "analysis": condensed_context, # Return the condensed context as analysis
-            "full_stage2_response": final_response # Optionally return the full stage 2 output for debugging
-        }
-    except httpx.HTTPError as e:
-        raise HTTPException(status_code=500, detail=f"Ollama API error: {e}")
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail="Invalid JSON response from Ollama API")
-    except Exception as e: # Catch broader exceptions
-        print(f"Unhandled error in chat handler: {e}") # Log the error
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    print("------ Thinking Prompt -------")
+    print(thinking_prompt)
 
+    return await generate_llm_response(thinking_prompt, ctx["model"])
 
-# Restoring the original two-stage chat handler
-@chat_router.post("/chat-pipeline")
-async def chat_handler_two_stage(request: Request):
-    try:
-        data = await request.json()
-        user_prompt = data.get("prompt")
-        selected_model = data.get("model", DEFAULT_MODEL)
+def condense(documents_stage: str, separator: str):
+    """Builds a stage that condenses the documents produced by `documents_stage` with the retrieval prompt."""
+    async def run(ctx):
+        if not ctx["selected_libraries"]:
+            print("------ Condensation Skipped (No Libraries Selected) -------")
+            return NO_LIBRARIES_MESSAGE
 
-        if not user_prompt:
-            raise HTTPException(status_code=400, detail="Prompt is required.")
+        documents = ctx[documents_stage]
+        if not documents:
+            print("------ Condensation Skipped (No Docs Found) -------")
+            return NO_DOCS_MESSAGE
 
-        # Get the libraries using the original method
-        selected_libraries = data.get("selected_libraries", [])
-        # Read config files for Pipeline
-        rag_preprompt, endoff, retrieval_prompt = await read_rag_config_files() # Use RAG config reader
+        _, _, retrieval_prompt = ctx["config"]
+        condensation_prompt = retrieval_prompt.replace("[INSERT QUESTION]", ctx["prompt"]).replace("[DOCUMENTATION_TEXT]", separator.join(documents))
 
-        if selected_libraries:
-            # Libraries selected, proceed with Stage 1 analysis
-            content_array = get_libraries(selected_libraries) # Uses the function from database.py
-            library_text = "\n---\n".join(content_array)
+        print("------ Condensation Prompt -------")
+        print(condensation_prompt)
 
-            # STAGE 1: Analysis and extraction of relevant documentation
-            # Replace placeholders in the retrieval prompt
-            stage1_prompt = retrieval_prompt.replace("[INSERT QUESTION]", user_prompt).replace("[DOCUMENTATION_TEXT]", library_text)
+        condensed_context = await generate_llm_response(condensation_prompt, ctx["model"])
 
-            print("------ Stage 1 Prompt -------")
-            print(stage1_prompt)
+        print("------ Condensed Context -------")
+        print(condensed_context)
+        return condensed_context
+    return run
 
-            # First LLM call to analyze and extract relevant information
-            stage1_response = await generate_llm_response(stage1_prompt, selected_model)
+def generate(build_prompt):
+    """Builds the final generation stage from a function that assembles its prompt from the context."""
+    async def run(ctx):
+        final_prompt = build_prompt(ctx)
 
-            print("------ Stage 1 Response -------")
-            print(stage1_response)
-        else:
-            # No libraries selected, skip Stage 1 and provide a default message
-            stage1_response = "No libraries were selected for analysis."
-            print("------ Stage 1 Skipped (No Libraries Selected) -------")
+        print("------ Final Prompt -------")
+        print(final_prompt)
 
+        return await generate_llm_response(final_prompt, ctx["model"])
+    return run
 
-        # STAGE 2: Use the extracted information (or default message) for final response
-        # Use the retrieved context in the final prompt
-        stage2_prompt = f"## Relevant Documentation:\n{stage1_response}\n\n--- End of Relevant Documentation ---\n\n{rag_preprompt.replace('[INSERT QUESTION]', user_prompt)}" # Use rag_preprompt
 
-        print("------ Stage 2 Prompt -------")
-        print(stage2_prompt)
+# --- Final Prompt Builders ---
 
-        # Second LLM call to generate the final answer
-        stage2_response = await generate_llm_response(stage2_prompt, selected_model)
+def plain_prompt(ctx):
+    return ctx["config"].replace("[INSERT QUESTION]", ctx["prompt"])
 
-        return {
-            "response": stage2_response,
-            "analysis": stage1_response  # Optionally return the first stage analysis
-        }
+def documentation_prompt(ctx):
+    preprompt, _, _ = ctx["config"]
+    return f"## Relevant Documentation:\n{ctx['condense']}\n\n--- End of Relevant Documentation ---\n\n{preprompt.replace('[INSERT QUESTION]', ctx['prompt'])}"
 
-    except httpx.HTTPError as e:
-        raise HTTPException(status_code=500, detail=f"Ollama API error: {e}")
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail="Invalid JSON response from Ollama API")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+def analyzed_context_prompt(ctx):
+    preprompt, _, _ = ctx["config"]
+    return f"## Relevant Documentation Context (Analyzed):\n{ctx['condense']}\n\n--- End of Analyzed Context ---\n\n{preprompt.replace('[INSERT QUESTION]', ctx['prompt'])}"
 
+def thinking_and_documentation_prompt(ctx):
+    return f"## Initial Reasoning:\n{ctx['think']}\n\n--- End of Initial Reasoning ---\n\n{documentation_prompt(ctx)}"
 
-# New endpoint combining RAG retrieval with condensation step
-@chat_router.post("/chat-rag-2")
-async def chat_handler_rag_2(request: Request):
+
+# --- Pipeline Definitions ---
+
+RAG_RETRIEVAL_STAGES = [
+    Stage("config", load_rag_config),
+    Stage("retrieve", retrieve),
+    Stage("expand_neighbors", expand_neighbors, after=("retrieve",)),
+    Stage("condense", condense("expand_neighbors", "\n\n---\n\n"), after=("config", "expand_neighbors")),
+]
+
+plain_pipeline = Pipeline("chat", [
+    Stage("config", load_plain_config),
+    Stage("generate", generate(plain_prompt), after=("config",)),
+])
+
+rag_pipeline = Pipeline("chat-rag", RAG_RETRIEVAL_STAGES + [
+    Stage("generate", generate(analyzed_context_prompt), after=("condense",)),
+])
+
+library_pipeline = Pipeline("chat-pipeline", [
+    Stage("config", load_rag_config),
+    Stage("load_libraries", load_libraries),
+    Stage("condense", condense("load_libraries", "\n---\n"), after=("config", "load_libraries")),
+    Stage("generate", generate(documentation_prompt), after=("condense",)),
+])
+
+rag_2_pipeline = Pipeline("chat-rag-2", RAG_RETRIEVAL_STAGES + [
+    Stage("generate", generate(documentation_prompt), after=("condense",)),
+])
+
+# Thinking runs concurrently with retrieve -> expand -> condense
+rag_think_pipeline = Pipeline("chat-rag-think", RAG_RETRIEVAL_STAGES + [
+    Stage("think", think),
+    Stage("generate", generate(thinking_and_documentation_prompt), after=("condense", "think")),
+])
+
+
+async def run_chat_pipeline(pipeline: Pipeline, request: Request) -> dict:
+    """Parses the chat request body, runs the pipeline and maps failures to HTTP errors."""
     try:
         data = await request.json()
         user_prompt = data.get("prompt")
-        selected_model = data.get("model", DEFAULT_MODEL)
 
         if not user_prompt:
             raise HTTPException(status_code=400, detail="Prompt is required.")
 
-        # Get selected libraries
-        selected_libraries = data.get("selected_libraries", []) # Expecting a list of integers (IDs)
-
-        # Read config files for RAG-2
-        rag_preprompt, endoff, retrieval_prompt = await read_rag_config_files() # Use RAG config reader
-
-        condensed_context = None # Initialize to None
+        return await pipeline.run(
+            prompt=user_prompt,
+            model=data.get("model", DEFAULT_MODEL),
+            selected_libraries=data.get("selected_libraries", []), # Expecting a list of integers (IDs)
+        )
 
-        if selected_libraries:
-            # Libraries selected, perform RAG retrieval with surrounding chunks
-            print("------ Performing RAG retrieval (with surrounding) (RAG-2) -------")
-            # Use the new function here
-            retrieved_docs = retrieve_relevant_chunks_surrounding(user_prompt, selected_libraries)
-            raw_retrieved_context = "\n\n---\n\n".join(retrieved_docs) # Join chunks with separators
+    except HTTPException as e:
+        # Re-raise HTTPExceptions directly
+        raise e
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Ollama API error: {e}")
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=500, detail="Invalid JSON response from Ollama API")
+    except Exception as e:
+        print(f"Unhandled error in {pipeline.name} handler: {e}") # Log the error
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
-            if not retrieved_docs: # Check if the list itself is empty
-                 raw_retrieved_context = "No relevant documentation found in the selected libraries."
-                 condensed_context = raw_retrieved_context # Use the 'not found' message directly
-                 print("------ Condensation Skipped (No Docs Found) (RAG-2) -------")
-            else:
-                # STAGE 1 (Condensation): Use retrieval prompt on RAG results
-                condensation_prompt = retrieval_prompt.replace("[INSERT QUESTION]", user_prompt).replace("[DOCUMENTATION_TEXT]", raw_retrieved_context)
 
-                print("------ Condensation Prompt (RAG-2) -------")
-                print(condensation_prompt)
+# --- Endpoints ---
 
-                # LLM call to condense/analyze the RAG context
-                condensed_context = await generate_llm_response(condensation_prompt, selected_model)
+# New Plain Chat Endpoint
+@chat_router.post("/chat")
+async def plain_chat_handler(request: Request):
+    ctx = await run_chat_pipeline(plain_pipeline, request)
+    return {"response": ctx["generate"]}
 
-                print("------ Condensed Context (RAG-2) -------")
-                print(condensed_context)
 
-        else:
-            # No libraries selected, skip RAG and Condensation
-            condensed_context = "No libraries were selected for analysis."
-            print("------ RAG and Condensation Skipped (No Libraries Selected) (RAG-2) -------")
+# RAG Chat Endpoint: retrieval (with surrounding chunks), condensation, analyzed-context generation
+@chat_router.post("/chat-rag")
+async def chat_rag_handler(request: Request):
+    ctx = await run_chat_pipeline(rag_pipeline, request)
+    final_response = ctx["generate"]
 
+    # Attempt to extract just the final answer part if preprompt-3 structure is followed
+    # This is brittle and depends on the LLM adhering to the structure.
+    try:
+        # Look for the synthesis part, assuming it's the closest to a final answer
+        answer_part = final_response.split("## Step 3: Final Synthesis & Strategy")[1]
+        answer_part = answer_part.split("---")[0].strip() # Get content before the next separator
+    except IndexError:
+        # If the structure isn't found, return the whole response
+        answer_part = final_response
 
-        # STAGE 2: Use the condensed context (or default message) for final response
-        stage2_prompt = f"## Relevant Documentation:\n{condensed_context}\n\n--- End of Relevant Documentation ---\n\n{rag_preprompt.replace('[INSERT QUESTION]', user_prompt)}" # Use rag_preprompt
+    return {
+        "response": answer_part, # Return the potentially extracted answer
+        "analysis": ctx["condense"], # Return the condensed context as analysis
+        "full_stage2_response": final_response # Optionally return the full stage 2 output for debugging
+    }
 
-        print("------ Stage 2 Prompt (RAG-2) -------")
-        print(stage2_prompt)
 
-        # Final LLM call to generate the answer
-        final_response = await generate_llm_response(stage2_prompt, selected_model)
+# Original two-stage chat handler: full library content from SQLite, condensation, generation
+@chat_router.post("/chat-pipeline")
+async def chat_handler_two_stage(request: Request):
+    ctx = await run_chat_pipeline(library_pipeline, request)
+    return {
+        "response": ctx["generate"],
+        "analysis": ctx["condense"]  # Optionally return the first stage analysis
+    }
 
-        return {
-            "response": final_response,
-            "analysis": condensed_context  # Return the condensed context as analysis
-        }
 
-    except httpx.HTTPError as e:
-        raise HTTPException(status_code=500, detail=f"Ollama API error: {e}")
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail="Invalid JSON response from Ollama API")
-    except Exception as e:
-        print(f"Unhandled error in chat handler (RAG-2): {e}") # Log the error
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+# RAG retrieval with condensation step
+@chat_router.post("/chat-rag-2")
+async def chat_handler_rag_2(request: Request):
+    ctx = await run_chat_pipeline(rag_2_pipeline, request)
+    return {
+        "response": ctx["generate"],
+        "analysis": ctx["condense"]  # Return the condensed context as analysis
+    }
+
+
+# RAG-2 plus a library-free chain-of-thought pass (preprompt-2) that runs alongside retrieval
+@chat_router.post("/chat-rag-think")
+async def chat_handler_rag_think(request: Request):
+    ctx = await run_chat_pipeline(rag_think_pipeline, request)
+    return {
+        "response": ctx["generate"],
+        "analysis": ctx["condense"],
+        "thinking": ctx["think"]
+    }
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException, status
+import io
+import zipfile
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from database import Library, SessionDep, LibraryUpdate # Import LibraryUpdate
 from sqlmodel import select
 # Import RAG service functions
 from rag_service import add_or_update_library, delete_library as rag_delete_library
+from snapshot_service import export_snapshot, import_snapshot
 
 
 db_router = APIRouter()
@@ -108,3 +113,42 @@ def reindex_library(library_id: int, session: SessionDep):
         # Raise an exception here so we know if re-indexing failed
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to re-index library {library_id}: {str(e)}")
+
+
+
+# Export all libraries and their embedded chunks as a single snapshot file
+@db_router.get('/snapshot/export')
+def export_library_snapshot():
+    buffer = io.BytesIO()
+    try:
+        manifest = export_snapshot(buffer)
+    except Exception as e:
+        print(f"--- Error exporting snapshot: {e} ---")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Failed to export snapshot: {str(e)}")
+
+    filename = f"localreason-snapshot-{manifest['created_at']}.zip"
+    return Response(
+        content=buffer.getvalue(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+# Import a snapshot (raw zip as the request body) without re-embedding anything
+@db_router.post('/snapshot/import', status_code=status.HTTP_200_OK)
+async def import_library_snapshot(request: Request):
+    body = await request.body()
+    if not body:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Snapshot file is required.")
+
+    try:
+        manifest = await run_in_threadpool(import_snapshot, io.BytesIO(body))
+    except (ValueError, KeyError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid snapshot: {str(e)}")
+    except Exception as e:
+        print(f"--- Error importing snapshot: {e} ---")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Failed to import snapshot: {str(e)}")
+
+    return {"message": f"Imported {manifest['num_libraries']} libraries and {manifest['num_chunks']} chunks.", "manifest": manifest}
@@ -0,0 +1,139 @@
+import io
+import json
+import sys
+import time
+import zipfile
+
+import numpy as np
+from sqlmodel import Session, select
+
+import rag_service
+from database import Library, create_db_and_tables, engine
+
+# --- Configuration ---
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def _snapshot_manifest(num_libraries: int, num_chunks: int, dim: int) -> dict:
+    return {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": int(time.time()),
+        "collection_name": rag_service.COLLECTION_NAME,
+        "vector_store": rag_service.VECTOR_STORE_BACKEND,
+        "embedding_model": rag_service.EMBEDDING_MODEL_NAME,
+        "chunk_size": rag_service.CHUNK_SIZE,
+        "chunk_overlap": rag_service.CHUNK_OVERLAP,
+        "num_libraries": num_libraries,
+        "num_chunks": num_chunks,
+        "embedding_dim": dim,
+    }
+
+
+def export_snapshot(fileobj):
+    """
+    Writes a snapshot of every Library row plus its indexed chunks (texts, metadata and
+    embeddings) to fileobj as a zip archive. Returns the snapshot manifest.
+    """
+    if not rag_service.vector_store:
+        raise RuntimeError("RAG service not initialized. Cannot export snapshot.")
+
+    with Session(engine) as session:
+        libraries = [library.model_dump() for library in session.exec(select(Library)).all()]
+
+    ids, documents, metadatas, embedding_matrix = rag_service.vector_store.dump()
+    dim = embedding_matrix.shape[1] if embedding_matrix.ndim == 2 else 0
+    manifest = _snapshot_manifest(len(libraries), len(ids), dim)
+
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+        archive.writestr("libraries.json", json.dumps(libraries))
+        archive.writestr("chunks.jsonl", "\n".join(
+            json.dumps({"id": chunk_id, "document": document, "metadata": metadata})
+            for chunk_id, document, metadata in zip(ids, documents, metadatas)
+        ))
+        # Embeddings are stored raw (already dense floats, deflate wouldn't gain much)
+        npy_buffer = io.BytesIO()
+        np.save(npy_buffer, embedding_matrix)
+        archive.writestr("embeddings.npy", npy_buffer.getvalue(), compress_type=zipfile.ZIP_STORED)
+
+    print(f"Exported snapshot: {len(libraries)} libraries, {len(ids)} chunks ({rag_service.EMBEDDING_MODEL_NAME}).")
+    return manifest
+
+
+def _check_manifest(manifest: dict):
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+    if manifest.get("embedding_model") != rag_service.EMBEDDING_MODEL_NAME:
+        raise ValueError(
+            f"Snapshot was built with embedding model '{manifest.get('embedding_model')}', "
+            f"but this node uses '{rag_service.EMBEDDING_MODEL_NAME}'."
+        )
+    if (manifest.get("chunk_size"), manifest.get("chunk_overlap")) != (rag_service.CHUNK_SIZE, rag_service.CHUNK_OVERLAP):
+        # Not fatal: the vectors are still valid, only future re-indexes will chunk differently
+        print(
+            f"Warning: snapshot chunk parameters ({manifest.get('chunk_size')}/{manifest.get('chunk_overlap')}) "
+            f"differ from this node ({rag_service.CHUNK_SIZE}/{rag_service.CHUNK_OVERLAP})."
+        )
+
+
+def import_snapshot(fileobj):
+    """
+    Loads a snapshot produced by export_snapshot. Library rows are upserted by ID and chunks
+    are bulk-loaded with their stored embeddings, so the embedding model is never called.
+    Returns the snapshot manifest.
+    """
+    if not rag_service.vector_store:
+        raise RuntimeError("RAG service not initialized. Cannot import snapshot.")
+
+    with zipfile.ZipFile(fileobj) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        _check_manifest(manifest)
+        libraries = json.loads(archive.read("libraries.json"))
+        chunk_lines = archive.read("chunks.jsonl").decode("utf-8").splitlines()
+        with archive.open("embeddings.npy") as f:
+            embedding_matrix = np.load(io.BytesIO(f.read()))
+
+    chunks = [json.loads(line) for line in chunk_lines if line]
+    if len(chunks) != len(embedding_matrix):
+        raise ValueError(f"Corrupt snapshot: {len(chunks)} chunks but {len(embedding_matrix)} embeddings.")
+
+    # 1. Restore SQLite rows, keeping IDs since chunk IDs and metadata reference them
+    create_db_and_tables()
+    with Session(engine) as session:
+        for row in libraries:
+            session.merge(Library(**row))
+        session.commit()
+
+    # 2. Drop any existing chunks for the imported libraries so stale chunk indices don't linger
+    for row in libraries:
+        if row.get("id") is not None:
+            rag_service.vector_store.delete_library(row["id"])
+            if rag_service.lexical_index:
+                rag_service.lexical_index.delete_library(row["id"])
+
+    # 3. Bulk-load chunks with precomputed embeddings
+    if chunks:
+        ids = [chunk["id"] for chunk in chunks]
+        documents = [chunk["document"] for chunk in chunks]
+        metadatas = [chunk["metadata"] for chunk in chunks]
+        rag_service.vector_store.add(ids, documents, metadatas, embeddings=embedding_matrix)
+        if rag_service.lexical_index:
+            rag_service.lexical_index.add(ids, documents, metadatas)
+
+    print(f"Imported snapshot: {len(libraries)} libraries, {len(chunks)} chunks.")
+    return manifest
+
+
+# Usage: python snapshot_service.py export|import <path>
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python snapshot_service.py export|import <snapshot.zip>")
+        sys.exit(1)
+
+    command, path = sys.argv[1], sys.argv[2]
+    if command == "export":
+        with open(path, "wb") as f:
+            export_snapshot(f)
+    else:
+        with open(path, "rb") as f:
+            import_snapshot(f)
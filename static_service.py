@@ -0,0 +1,258 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+
+try:
+    # Optional: brotli variants are only built if the package is installed
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Configuration ---
+MAX_IN_MEMORY_SIZE = 1024 * 1024 # Files larger than this are streamed from disk (sendfile when the server supports it)
+COMPRESSED_CACHE_DIR = os.getenv("STATIC_CACHE_DIR", "./static_cache") # Compressed copies of large files, keyed by content hash
+MIN_COMPRESS_SIZE = 512 # Compressing tiny files isn't worth the extra headers
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml", "application/wasm")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache" # Browser must revalidate, which is a cheap 304 thanks to the ETag
+
+# Vite emits content-hashed filenames like assets/index-BQ3f_x9a.js (8 char hash, only under assets/)
+HASHED_ASSET_RE = re.compile(r"^assets/[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+
+class StaticAsset:
+    """
+    A single file from the dist directory, with its precompressed variants. Small files keep
+    their variants in memory; large files get compressed copies on disk (from the build, or
+    written once to cache_directory) that are streamed like the original.
+    """
+
+    def __init__(self, full_path: str, rel_path: str, cache_directory: str = COMPRESSED_CACHE_DIR):
+        self.full_path = full_path
+        self.rel_path = rel_path
+        self.media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        self.immutable = bool(HASHED_ASSET_RE.search(rel_path))
+
+        stat = os.stat(full_path)
+        self.size = stat.st_size
+        self.body = None # Raw bytes, only kept for small files
+        self.variants = {} # encoding -> compressed bytes (small files)
+        self.variant_paths = {} # encoding -> compressed file path (large files)
+
+        hasher = hashlib.sha256()
+        if self.size <= MAX_IN_MEMORY_SIZE:
+            with open(full_path, "rb") as f:
+                self.body = f.read()
+            hasher.update(self.body)
+        else:
+            with open(full_path, "rb") as f:
+                for block in iter(lambda: f.read(64 * 1024), b""):
+                    hasher.update(block)
+        # Strong ETag derived from the file content, stable across restarts and replicas
+        self.etag = f'"{hasher.hexdigest()[:32]}"'
+
+        if self._is_compressible():
+            if self.body is not None:
+                self._build_variants()
+            else:
+                self._build_variant_files(cache_directory)
+
+    def _is_compressible(self) -> bool:
+        return self.size >= MIN_COMPRESS_SIZE and self.media_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _build_variants(self):
+        # Prefer variants produced by the frontend build (e.g. vite-plugin-compression) if present
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            precompressed_path = self.full_path + suffix
+            if os.path.isfile(precompressed_path):
+                with open(precompressed_path, "rb") as f:
+                    self.variants[encoding] = f.read()
+
+        if "gzip" not in self.variants:
+            self.variants["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if "br" not in self.variants and brotli is not None:
+            self.variants["br"] = brotli.compress(self.body, quality=11)
+
+        # Drop variants that didn't actually save anything
+        self.variants = {enc: data for enc, data in self.variants.items() if len(data) < self.size}
+
+    def _build_variant_files(self, cache_directory: str):
+        # Same preference for build output, otherwise compress once into the cache (reused across restarts)
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            precompressed_path = self.full_path + suffix
+            if os.path.isfile(precompressed_path):
+                self.variant_paths[encoding] = precompressed_path
+                continue
+            if encoding == "br" and brotli is None:
+                continue
+
+            cached_path = os.path.join(cache_directory, self.etag.strip('"') + suffix)
+            if not os.path.isfile(cached_path):
+                try:
+                    os.makedirs(cache_directory, exist_ok=True)
+                    self._compress_to(encoding, cached_path)
+                except OSError as e:
+                    print(f"Could not write {encoding} copy of {self.rel_path} to {cache_directory}: {e}")
+                    continue
+            self.variant_paths[encoding] = cached_path
+
+        self.variant_paths = {enc: path for enc, path in self.variant_paths.items() if os.path.getsize(path) < self.size}
+
+    def _compress_to(self, encoding: str, path: str):
+        # Unique temp name, workers starting at the same time may compress the same file
+        tmp_path = f"{path}.{uuid.uuid4().hex[:12]}.tmp"
+        try:
+            with open(self.full_path, "rb") as src, open(tmp_path, "wb") as dst:
+                if encoding == "gzip":
+                    with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=9, mtime=0) as gz:
+                        shutil.copyfileobj(src, gz, 64 * 1024)
+                else:
+                    compressor = brotli.Compressor(quality=11)
+                    for block in iter(lambda: src.read(64 * 1024), b""):
+                        dst.write(compressor.process(block))
+                    dst.write(compressor.finish())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @property
+    def encodings(self) -> set[str]:
+        return set(self.variants) | set(self.variant_paths)
+
+    def etag_for(self, encoding: str | None) -> str:
+        # Strong validators must differ between content-codings of the same file
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    @property
+    def cache_control(self) -> str:
+        return IMMUTABLE_CACHE_CONTROL if self.immutable else REVALIDATE_CACHE_CONTROL
+
+
+def parse_accept_encoding(header: str) -> set[str]:
+    """Returns the set of encodings the client accepts (q > 0)."""
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(token)
+    return accepted
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check, using weak comparison (W/ prefixes are ignored) as RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+
+class SPAStaticFiles:
+    """
+    ASGI app serving a built SPA from an in-memory manifest.
+
+    The dist directory is scanned once at startup. Every request is resolved with a
+    dict lookup, unknown paths fall back to index.html (so client-side routes work)
+    without touching the disk again, and gzip/brotli variants are built up front.
+    """
+
+    def __init__(self, directory: str, fallback: str = "index.html", cache_directory: str = COMPRESSED_CACHE_DIR):
+        if not os.path.isdir(directory):
+            raise RuntimeError(f"Directory '{directory}' does not exist")
+        self.directory = directory
+        self.manifest = self._build_manifest(directory, cache_directory)
+        self.fallback = self.manifest.get(fallback)
+        assets = {asset.rel_path: asset for asset in self.manifest.values()} # Ignore directory aliases
+        compressed = sum(1 for asset in assets.values() if asset.encodings)
+        print(f"Static manifest built for {directory}: {len(assets)} files ({compressed} precompressed).")
+
+    @staticmethod
+    def _build_manifest(directory: str, cache_directory: str) -> dict[str, StaticAsset]:
+        manifest = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                # Skip on-disk precompressed copies, they're attached to their source file
+                if name.endswith((".gz", ".br")) and os.path.isfile(os.path.join(root, name[:-3])):
+                    continue
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, directory).replace(os.sep, "/")
+                manifest[rel_path] = StaticAsset(full_path, rel_path, cache_directory)
+
+        # Directory-style URLs ("/", "/docs/") resolve to their index.html like StaticFiles(html=True)
+        for rel_path, asset in list(manifest.items()):
+            if rel_path == "index.html":
+                manifest[""] = asset
+            elif rel_path.endswith("/index.html"):
+                manifest[rel_path[: -len("index.html")]] = asset
+                manifest[rel_path[: -len("/index.html")]] = asset
+        return manifest
+
+    def lookup(self, path: str) -> StaticAsset | None:
+        return self.manifest.get(path.lstrip("/")) or self.fallback
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+            await response(scope, receive, send)
+            return
+
+        # Mounted at "/", so the full request path is the path inside dist
+        asset = self.lookup(scope["path"])
+        if asset is None:
+            response = PlainTextResponse("Not Found", status_code=404)
+        else:
+            response = self.build_response(asset, Headers(scope=scope))
+        await response(scope, receive, send)
+
+    def build_response(self, asset: StaticAsset, request_headers: Headers) -> Response:
+        # Pick the variant first, the ETag (and the 304 check) depend on it
+        encoding = None
+        encodings = asset.encodings
+        if encodings:
+            accepted = parse_accept_encoding(request_headers.get("accept-encoding", ""))
+            for candidate in ("br", "gzip"):
+                if candidate in accepted and candidate in encodings:
+                    encoding = candidate
+                    break
+
+        headers = {
+            "ETag": asset.etag_for(encoding),
+            "Cache-Control": asset.cache_control,
+        }
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(request_headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+
+        if asset.body is None:
+            # Large file: let the server stream it (uses sendfile/pathsend when available)
+            path = asset.full_path if encoding is None else asset.variant_paths[encoding]
+            return FileResponse(path, media_type=asset.media_type, headers=headers)
+
+        content = asset.body if encoding is None else asset.variants[encoding]
+        return Response(content=content, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,38 @@
+import importlib
+import zlib
+
+import pytest
+
+import embedding_service
+from lexical_index import LexicalIndex
+from vector_store import NumpyVectorStore
+
+
+class HashEmbeddings:
+    """Deterministic stand-in for the embedding model, counts how often it is called."""
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        return [[(zlib.crc32(f"{i}:{text}".encode()) % 1000) / 1000.0 + 0.001 for i in range(self.dim)] for text in texts]
+
+
+@pytest.fixture
+def rag_service(tmp_path, monkeypatch):
+    """
+    rag_service wired to a NumpyVectorStore and LexicalIndex under tmp_path. The module is
+    first imported from tmp_path with the embedding service configured, so initialization
+    neither loads a model nor creates index directories in the repo.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(embedding_service, "EMBEDDING_SERVICE_URL", "http://127.0.0.1:8765")
+    monkeypatch.setenv("VECTOR_STORE_BACKEND", "numpy")
+    module = importlib.import_module("rag_service")
+
+    monkeypatch.setattr(module, "RETRIEVAL_MODE", "hybrid")
+    monkeypatch.setattr(module, "vector_store", NumpyVectorStore(str(tmp_path / "vectors"), HashEmbeddings()))
+    monkeypatch.setattr(module, "lexical_index", LexicalIndex(str(tmp_path / "lexical")))
+    return module
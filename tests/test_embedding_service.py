@@ -0,0 +1,138 @@
+import asyncio
+import sys
+import time
+import types
+
+import chromadb
+import httpx
+import numpy as np
+import pytest
+from chromadb.utils import embedding_functions
+
+import embedding_service
+from embedding_service import MicroBatcher, RemoteEmbeddingFunction
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model_name_or_path, device="cpu", **kwargs):
+        pass
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+@pytest.fixture
+def baseline_ef(monkeypatch):
+    # SentenceTransformerEmbeddingFunction loads the model eagerly, swap in a fake one
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=FakeSentenceTransformer))
+    monkeypatch.setattr(embedding_functions.SentenceTransformerEmbeddingFunction, "models", {})
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+
+
+@pytest.fixture
+def remote_ef(monkeypatch):
+    monkeypatch.setattr(embedding_service, "EMBEDDING_SERVICE_URL", "http://127.0.0.1:8765")
+    return RemoteEmbeddingFunction("all-MiniLM-L6-v2")
+
+
+def test_reopens_collection_created_with_sentence_transformer(tmp_path, baseline_ef, remote_ef):
+    # Collection as created by rag_service before the embedding service existed
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    client.get_or_create_collection(name="library_docs", embedding_function=baseline_ef, metadata={"hnsw:space": "cosine"})
+
+    reopened = chromadb.PersistentClient(path=str(tmp_path)).get_or_create_collection(
+        name="library_docs", embedding_function=remote_ef, metadata={"hnsw:space": "cosine"}
+    )
+    assert reopened.name == "library_docs"
+
+
+def test_local_model_reopens_collection_created_with_service(tmp_path, baseline_ef, remote_ef):
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    client.get_or_create_collection(name="library_docs", embedding_function=remote_ef, metadata={"hnsw:space": "cosine"})
+
+    reopened = chromadb.PersistentClient(path=str(tmp_path)).get_or_create_collection(
+        name="library_docs", embedding_function=baseline_ef, metadata={"hnsw:space": "cosine"}
+    )
+    assert reopened.name == "library_docs"
+
+
+def test_config_matches_sentence_transformer(baseline_ef, remote_ef):
+    assert remote_ef.name() == baseline_ef.name()
+    assert remote_ef.get_config() == baseline_ef.get_config()
+
+
+def run_with_batcher(encode, scenario, max_batch_size=4, max_wait=0.01):
+    async def main():
+        batcher = MicroBatcher(encode, max_batch_size=max_batch_size, max_wait=max_wait)
+        batcher.start()
+        try:
+            return await scenario(batcher)
+        finally:
+            batcher.worker.cancel()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_encode_call():
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    async def scenario(batcher):
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["bb", "ccc"]))
+
+    first, second = run_with_batcher(encode, scenario)
+    assert batches == [["a", "bb", "ccc"]]
+    # Each request gets back only its own rows
+    assert first == [[1.0]]
+    assert second == [[2.0], [3.0]]
+
+
+def test_encode_errors_reach_every_waiting_request():
+    def encode(texts):
+        raise RuntimeError("model crashed")
+
+    async def scenario(batcher):
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+
+    results = run_with_batcher(encode, scenario)
+    assert [str(result) for result in results] == ["model crashed", "model crashed"]
+
+
+def test_oversized_request_is_split_and_interleaved():
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        time.sleep(0.02)
+        return [[float(len(text))] for text in texts]
+
+    async def scenario(batcher):
+        library = asyncio.create_task(batcher.embed([f"chunk{i}" for i in range(10)]))
+        await asyncio.sleep(0.005) # Chat query arrives while the first piece is being encoded
+        query = await batcher.embed(["q"])
+        assert not library.done()
+        return query, await library
+
+    query, library = run_with_batcher(encode, scenario, max_batch_size=4)
+    assert query == [[1.0]]
+    assert library == [[float(len(f"chunk{i}"))] for i in range(10)]
+    assert batches[0] == ["chunk0", "chunk1", "chunk2", "chunk3"]
+    assert "q" in batches[1]
+    assert all(len(batch) <= 5 for batch in batches)
+    assert sorted(text for batch in batches for text in batch if text != "q") == sorted(f"chunk{i}" for i in range(10))
+
+
+def test_client_sends_large_inputs_in_several_calls(remote_ef, monkeypatch):
+    calls = []
+
+    def post(path, json):
+        calls.append(len(json["texts"]))
+        return httpx.Response(200, json={"model": "all-MiniLM-L6-v2", "embeddings": [[0.0]] * len(json["texts"])}, request=httpx.Request("POST", path))
+
+    monkeypatch.setattr(embedding_service, "MAX_REQUEST_TEXTS", 4)
+    monkeypatch.setattr(remote_ef.client, "post", post)
+    assert len(remote_ef([f"t{i}" for i in range(10)])) == 10
+    assert calls == [4, 4, 2]
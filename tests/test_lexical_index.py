@@ -0,0 +1,108 @@
+import pytest
+
+from lexical_index import LexicalIndex, extract_identifiers, reciprocal_rank_fusion
+
+
+def test_prose_names_are_not_identifiers():
+    assert extract_identifiers("How do I use JavaScript on GitHub with iOS and FastAPI?") == []
+
+
+def test_code_identifiers():
+    query = "Where are SPAStaticFiles, getUserName, add_or_update_library and `html` used?"
+    assert extract_identifiers(query) == ["html", "spastaticfiles", "getusername", "add_or_update_library"]
+
+
+def test_only_rare_identifiers_take_lexical_path(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    documents = [f"chunk {i} mentions get_value" for i in range(20)] + ["class SPAStaticFiles(StaticFiles)"]
+    index.add(
+        [f"lib_1_chunk_{i}" for i in range(len(documents))],
+        documents,
+        [{"library_id": 1, "chunk_index": i} for i in range(len(documents))],
+    )
+
+    assert index.rare_identifiers("what does get_value return in SPAStaticFiles", [1]) == ["spastaticfiles"]
+    assert index.rare_identifiers("what does get_value return", [1]) == []
+    assert index.rare_identifiers("what is missing_name", [1]) == []
+
+
+def _reindex_worker(path, library_id, seed):
+    index = LexicalIndex(path)
+    for round_number in range(30):
+        index.delete_library(library_id)
+        index.add(
+            [f"lib_{library_id}_chunk_{i}" for i in range(20)],
+            [f"writer {seed} round {round_number} chunk {i}" for i in range(20)],
+            [{"library_id": library_id, "chunk_index": i} for i in range(20)],
+        )
+
+
+def test_concurrent_reindex_from_processes(tmp_path):
+    import multiprocessing
+
+    processes = [multiprocessing.Process(target=_reindex_worker, args=(str(tmp_path), 1, seed)) for seed in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    assert not list(tmp_path.glob("*.tmp"))
+    # Every chunk comes from the same writer's last round, never a mix of two re-indexes
+    documents = LexicalIndex(str(tmp_path)).search("writer round chunk", [1], 20)["documents"]
+    assert len(documents) == 20
+    assert len({document.rsplit(" chunk ", 1)[0] for document in documents}) == 1
+
+
+def test_search_uses_postings_persisted_at_write_time(tmp_path, monkeypatch):
+    import lexical_index
+
+    documents = ["the app mounts SPAStaticFiles at the root", "the app serves the api", "how the index works"]
+    LexicalIndex(str(tmp_path)).add(
+        [f"lib_1_chunk_{i}" for i in range(3)],
+        documents,
+        [{"library_id": 1, "chunk_index": i} for i in range(3)],
+    )
+    full = LexicalIndex(str(tmp_path)).search("how does the app use SPAStaticFiles", [1], 3)
+
+    # A fresh worker must not tokenize the library again
+    def fail(documents):
+        raise AssertionError("library was re-tokenized on load")
+
+    monkeypatch.setattr(lexical_index, "index_documents", fail)
+    reader = LexicalIndex(str(tmp_path))
+    hits = reader.search("how does the app use SPAStaticFiles", [1], 3, required_terms=["spastaticfiles"])
+
+    # Only the candidate is returned, with the same BM25 score as in the unrestricted search
+    assert hits["ids"] == ["lib_1_chunk_0"]
+    assert hits["scores"][0] == full["scores"][full["ids"].index("lib_1_chunk_0")]
+
+
+def test_bm25_ranks_rare_terms_above_common_ones(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    documents = ["cache invalidation", "invalidation notes", "cache warming", "cache sizing", "routing table"]
+    index.add(
+        [f"lib_1_chunk_{i}" for i in range(len(documents))],
+        documents,
+        [{"library_id": 1, "chunk_index": i} for i in range(len(documents))],
+    )
+
+    hits = index.search("cache invalidation", [1], 10)
+    # Both terms beat one, the rare term beats the common one, chunks without query terms aren't returned
+    assert hits["ids"][:2] == ["lib_1_chunk_0", "lib_1_chunk_1"]
+    assert set(hits["ids"][2:]) == {"lib_1_chunk_2", "lib_1_chunk_3"}
+    assert hits["scores"] == sorted(hits["scores"], reverse=True)
+    assert index.search("cache", [2], 10)["ids"] == []
+
+
+def test_reciprocal_rank_fusion_merges_and_reranks():
+    def ranked(*ids):
+        return {"ids": list(ids), "documents": [f"doc {i}" for i in ids], "metadatas": [{"id": i} for i in ids]}
+
+    fused = reciprocal_rank_fusion([ranked("a", "b", "c"), ranked("c", "d")], k=3)
+
+    # c appears in both lists and overtakes a, which only tops one of them
+    assert fused["ids"] == ["c", "a", "b"]
+    assert fused["documents"] == ["doc c", "doc a", "doc b"]
+    assert fused["metadatas"] == [{"id": "c"}, {"id": "a"}, {"id": "b"}]
+    assert fused["scores"][0] == pytest.approx(1 / 63 + 1 / 61)
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from pipeline_engine import Pipeline, Stage
+
+
+def sleeper(name, seconds, events, result=None):
+    async def run(context):
+        events.append(("start", name))
+        await asyncio.sleep(seconds)
+        events.append(("end", name))
+        return result if result is not None else name
+    return run
+
+
+def test_independent_stages_run_concurrently():
+    events = []
+    pipeline = Pipeline("test", [
+        Stage("think", sleeper("think", 0.1, events)),
+        Stage("retrieve", sleeper("retrieve", 0.1, events)),
+    ])
+
+    started = time.perf_counter()
+    context = asyncio.run(pipeline.run(prompt="hi"))
+
+    assert time.perf_counter() - started < 0.18 # Not 0.2, the two sleeps overlap
+    assert events[:2] == [("start", "think"), ("start", "retrieve")]
+    assert context == {"prompt": "hi", "think": "think", "retrieve": "retrieve"}
+
+
+def test_stages_wait_for_their_dependencies():
+    events = []
+
+    def generate(context):
+        # Sync stages run in the threadpool and see every dependency's output
+        events.append(("start", "generate"))
+        return f"{context['prompt']}: {context['retrieve']} + {context['think']}"
+
+    pipeline = Pipeline("test", [
+        Stage("retrieve", sleeper("retrieve", 0.05, events, result="chunks")),
+        Stage("think", sleeper("think", 0.01, events, result="notes")),
+        Stage("generate", generate, after=("retrieve", "think")),
+    ])
+    context = asyncio.run(pipeline.run(prompt="q"))
+
+    assert context["generate"] == "q: chunks + notes"
+    assert events.index(("start", "generate")) > events.index(("end", "retrieve"))
+    assert events.index(("start", "generate")) > events.index(("end", "think"))
+
+
+def test_invalid_pipelines_are_rejected_when_built():
+    noop = sleeper("noop", 0, [])
+
+    with pytest.raises(ValueError, match="later stage 'retrieve'"):
+        Pipeline("test", [Stage("generate", noop, after=("retrieve",)), Stage("retrieve", noop)])
+    with pytest.raises(ValueError, match="unknown or later stage 'missing'"):
+        Pipeline("test", [Stage("generate", noop, after=("missing",))])
+    with pytest.raises(ValueError, match="duplicate stage 'retrieve'"):
+        Pipeline("test", [Stage("retrieve", noop), Stage("retrieve", noop)])
+
+
+def test_failing_stage_cancels_the_others():
+    events = []
+
+    async def fail(context):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("retrieval failed")
+
+    pipeline = Pipeline("test", [
+        Stage("retrieve", fail),
+        Stage("think", sleeper("think", 1.0, events)),
+        Stage("generate", sleeper("generate", 0, events), after=("retrieve", "think")),
+    ])
+
+    started = time.perf_counter()
+    with pytest.raises(RuntimeError, match="retrieval failed"):
+        asyncio.run(pipeline.run(prompt="q"))
+
+    assert time.perf_counter() - started < 0.5 # think was cancelled, not awaited
+    assert ("end", "think") not in events
+    assert ("start", "generate") not in events
+
+
+@pytest.mark.parametrize("error, detail", [
+    (RuntimeError("retrieval failed"), "An unexpected error occurred: retrieval failed"),
+    (httpx.ConnectError("connection refused"), "Ollama API error: connection refused"),
+])
+def test_stage_errors_reach_run_chat_pipeline(rag_service, error, detail):
+    from routers.chat import run_chat_pipeline
+
+    async def fail(context):
+        raise error
+
+    pipeline = Pipeline("test", [Stage("retrieve", fail), Stage("think", sleeper("think", 1.0, []))])
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def chat(request: Request):
+        return await run_chat_pipeline(pipeline, request)
+
+    response = TestClient(app).post("/chat", json={"prompt": "hi"})
+    assert response.status_code == 500
+    assert response.json()["detail"] == detail
@@ -0,0 +1,67 @@
+from database import Library
+
+
+def test_failed_vector_delete_still_deletes_lexical_entries(rag_service, monkeypatch, capsys):
+    library = Library(id=1, name="docs", content="SPAStaticFiles serves the frontend build.")
+    rag_service.add_or_update_library(library)
+
+    def fail(library_id):
+        raise RuntimeError("vector store unavailable")
+
+    monkeypatch.setattr(rag_service.vector_store, "delete_library", fail)
+    rag_service.delete_library(1)
+
+    assert rag_service.lexical_index.search("SPAStaticFiles", [1], 5)["ids"] == []
+    assert "Error deleting chunks from vector store" in capsys.readouterr().out
+
+
+def test_lexical_add_failure_is_reported_separately(rag_service, monkeypatch, capsys):
+    def fail(ids, documents, metadatas):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(rag_service.lexical_index, "add", fail)
+    rag_service.add_or_update_library(Library(id=1, name="docs", content="SPAStaticFiles serves the frontend build."))
+
+    out = capsys.readouterr().out
+    assert "Successfully added/updated 1 chunks for library ID: 1" in out
+    assert "Error adding chunks to lexical index for library ID 1: disk full" in out
+    assert "Error adding chunks to vector store" not in out
+    assert rag_service.vector_store.get(["lib_1_chunk_0"]) == ["SPAStaticFiles serves the frontend build."]
+
+
+def test_identifier_query_skips_vector_search(rag_service, monkeypatch):
+    rag_service.add_or_update_library(Library(id=1, name="docs", content="class SPAStaticFiles serves the frontend build."))
+
+    def fail(query, library_ids, k):
+        raise AssertionError("vector store queried for an identifier lookup")
+
+    monkeypatch.setattr(rag_service.vector_store, "query", fail)
+    hits = rag_service.search_chunks("Where is SPAStaticFiles defined?", [1], 5)
+    assert hits["ids"] == ["lib_1_chunk_0"]
+
+
+def test_prose_query_fuses_vector_and_lexical_results(rag_service, monkeypatch):
+    def ranked(*ids):
+        return {"ids": list(ids), "documents": list(ids), "metadatas": [{} for _ in ids], "distances": [0.0] * len(ids)}
+
+    monkeypatch.setattr(rag_service.vector_store, "query", lambda query, library_ids, k: ranked("v1", "both"))
+    monkeypatch.setattr(rag_service.lexical_index, "search", lambda query, library_ids, k, required_terms=None: ranked("both", "l1"))
+
+    hits = rag_service.search_chunks("how is the frontend served", [1], 3)
+    assert hits["ids"][0] == "both"
+    assert set(hits["ids"]) == {"v1", "both", "l1"}
+
+
+def test_indexing_keeps_lexical_index_in_sync(rag_service):
+    rag_service.add_or_update_library(Library(id=1, name="docs", content="legacy_loader is deprecated."))
+    assert rag_service.lexical_index.search("legacy_loader", [1], 5)["ids"] == ["lib_1_chunk_0"]
+
+    # Re-indexing replaces the old chunks in both stores
+    rag_service.add_or_update_library(Library(id=1, name="docs", content="stream_parser replaces it."))
+    assert rag_service.lexical_index.search("legacy_loader", [1], 5)["ids"] == []
+    assert rag_service.lexical_index.search("stream_parser", [1], 5)["documents"] == ["stream_parser replaces it."]
+    assert rag_service.vector_store.get(["lib_1_chunk_0"]) == ["stream_parser replaces it."]
+
+    rag_service.delete_library(1)
+    assert rag_service.lexical_index.search("stream_parser", [1], 5)["ids"] == []
+    assert rag_service.vector_store.get(["lib_1_chunk_0"]) == []
@@ -0,0 +1,122 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import database
+from database import Library
+
+
+@pytest.fixture
+def snapshot_service(rag_service, tmp_path, monkeypatch):
+    import snapshot_service
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(snapshot_service, "engine", engine)
+    return snapshot_service
+
+
+def library_rows(engine) -> list[dict]:
+    with Session(engine) as session:
+        return [library.model_dump() for library in session.exec(select(Library).order_by(Library.id)).all()]
+
+
+def exported_snapshot(snapshot_service, rag_service) -> bytes:
+    with Session(snapshot_service.engine) as session:
+        session.add(Library(id=1, name="fastapi", description="FastAPI docs", content="Path operations. Dependencies."))
+        session.add(Library(id=2, name="numpy", content="Arrays and broadcasting."))
+        session.commit()
+
+    rag_service.vector_store.add(
+        ["lib_1_chunk_0", "lib_1_chunk_1", "lib_2_chunk_0"],
+        ["Path operations.", "Dependencies.", "Arrays and broadcasting."],
+        [{"library_id": 1, "chunk_index": 0}, {"library_id": 1, "chunk_index": 1}, {"library_id": 2, "chunk_index": 0}],
+    )
+    buffer = io.BytesIO()
+    snapshot_service.export_snapshot(buffer)
+    return buffer.getvalue()
+
+
+def rewrite_snapshot(snapshot: bytes, **replacements) -> bytes:
+    """Copy of a snapshot zip with some members replaced."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(snapshot)) as source, zipfile.ZipFile(buffer, "w") as target:
+        for name in source.namelist():
+            target.writestr(name, replacements.get(name, source.read(name)))
+    return buffer.getvalue()
+
+
+def test_round_trip_restores_rows_chunks_and_embeddings(snapshot_service, rag_service, tmp_path, monkeypatch):
+    snapshot = exported_snapshot(snapshot_service, rag_service)
+    rows = library_rows(snapshot_service.engine)
+    ids, documents, metadatas, embeddings = rag_service.vector_store.dump()
+
+    # Import on a fresh node: empty database, empty stores, an embedding function that must not be called
+    node = tmp_path / "node"
+    engine = create_engine(f"sqlite:///{tmp_path / 'node.db'}")
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(snapshot_service, "engine", engine)
+
+    def fail(texts):
+        raise AssertionError("embedding function called during import")
+
+    from lexical_index import LexicalIndex
+    from vector_store import NumpyVectorStore
+
+    monkeypatch.setattr(rag_service, "vector_store", NumpyVectorStore(str(node / "vectors"), fail))
+    monkeypatch.setattr(rag_service, "lexical_index", LexicalIndex(str(node / "lexical")))
+
+    manifest = snapshot_service.import_snapshot(io.BytesIO(snapshot))
+
+    assert manifest["num_libraries"] == 2 and manifest["num_chunks"] == 3
+    assert library_rows(engine) == rows
+    imported_ids, imported_documents, imported_metadatas, imported_embeddings = rag_service.vector_store.dump()
+    assert imported_ids == ids
+    assert imported_documents == documents
+    assert imported_metadatas == metadatas
+    np.testing.assert_allclose(imported_embeddings, embeddings, atol=1e-3) # float16 storage
+    assert rag_service.lexical_index.search("broadcasting", [2], 5)["ids"] == ["lib_2_chunk_0"]
+
+
+def test_mismatched_embedding_model_is_rejected(snapshot_service, rag_service):
+    snapshot = exported_snapshot(snapshot_service, rag_service)
+    with zipfile.ZipFile(io.BytesIO(snapshot)) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+    manifest["embedding_model"] = "another-model"
+
+    with pytest.raises(ValueError, match="another-model"):
+        snapshot_service.import_snapshot(io.BytesIO(rewrite_snapshot(snapshot, **{"manifest.json": json.dumps(manifest)})))
+
+
+def test_chunk_and_embedding_count_mismatch_is_rejected(snapshot_service, rag_service):
+    snapshot = exported_snapshot(snapshot_service, rag_service)
+    npy_buffer = io.BytesIO()
+    np.save(npy_buffer, np.zeros((2, 8), dtype=np.float32))
+
+    with pytest.raises(ValueError, match="3 chunks but 2 embeddings"):
+        snapshot_service.import_snapshot(io.BytesIO(rewrite_snapshot(snapshot, **{"embeddings.npy": npy_buffer.getvalue()})))
+
+
+def test_import_endpoint_turns_invalid_snapshots_into_400(snapshot_service, rag_service):
+    from routers.db import db_router
+
+    app = FastAPI()
+    app.include_router(db_router, prefix="/db")
+    client = TestClient(app)
+
+    snapshot = exported_snapshot(snapshot_service, rag_service)
+    npy_buffer = io.BytesIO()
+    np.save(npy_buffer, np.zeros((2, 8), dtype=np.float32))
+    corrupt = rewrite_snapshot(snapshot, **{"embeddings.npy": npy_buffer.getvalue()})
+
+    response = client.post("/db/snapshot/import", content=corrupt)
+    assert response.status_code == 400
+    assert "3 chunks but 2 embeddings" in response.json()["detail"]
+    assert client.post("/db/snapshot/import", content=b"not a zip").status_code == 400
@@ -0,0 +1,117 @@
+import gzip
+
+import pytest
+from starlette.testclient import TestClient
+
+import static_service
+from static_service import SPAStaticFiles
+
+BUNDLE = ("export function render() { return 'vendor bundle'; }\n" * 200).encode()
+
+
+@pytest.fixture
+def dist(tmp_path):
+    directory = tmp_path / "dist"
+    (directory / "assets").mkdir(parents=True)
+    (directory / "index.html").write_text("<!doctype html><div id=root></div>")
+    (directory / "robots.txt").write_text("User-agent: *")
+    (directory / "assets" / "index-BQ3f_x9a.js").write_bytes(BUNDLE)
+    return directory
+
+
+def client_for(dist, tmp_path) -> TestClient:
+    return TestClient(SPAStaticFiles(directory=str(dist), cache_directory=str(tmp_path / "cache")))
+
+
+def test_large_files_are_compressed_into_cache(dist, tmp_path, monkeypatch):
+    monkeypatch.setattr(static_service, "MAX_IN_MEMORY_SIZE", 1024)
+    client = client_for(dist, tmp_path)
+
+    response = client.get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"].endswith('-gzip"')
+    assert response.content == BUNDLE # Decoded by the client
+    assert list((tmp_path / "cache").glob("*.gz"))
+
+    if static_service.brotli is not None:
+        assert client.get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": "gzip, br"}).headers["content-encoding"] == "br"
+
+    identity = client.get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.content == BUNDLE
+
+
+def test_large_files_prefer_precompressed_build_output(dist, tmp_path, monkeypatch):
+    monkeypatch.setattr(static_service, "MAX_IN_MEMORY_SIZE", 1024)
+    (dist / "assets" / "index-BQ3f_x9a.js.gz").write_bytes(gzip.compress(b"from the build"))
+    client = client_for(dist, tmp_path)
+
+    response = client.get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == b"from the build"
+    assert not list((tmp_path / "cache").glob("*.gz"))
+
+
+def test_known_paths_and_spa_fallback(dist, tmp_path):
+    client = client_for(dist, tmp_path)
+
+    assert client.get("/robots.txt").text == "User-agent: *"
+    assert client.get("/").text == "<!doctype html><div id=root></div>"
+    # Client-side routes get index.html
+    fallback = client.get("/libraries/3/edit")
+    assert fallback.status_code == 200
+    assert fallback.headers["content-type"].startswith("text/html")
+    assert fallback.text == "<!doctype html><div id=root></div>"
+    assert client.post("/robots.txt").status_code == 405
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("identity", None),
+    ("", None),
+])
+def test_accept_encoding_negotiation(dist, tmp_path, accept_encoding, expected):
+    if expected == "br" and static_service.brotli is None:
+        pytest.skip("brotli not installed")
+    response = client_for(dist, tmp_path).get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": accept_encoding})
+
+    assert response.headers.get("content-encoding") == expected
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == BUNDLE
+
+
+def test_cache_control_for_hashed_and_unhashed_files(dist, tmp_path):
+    (dist / "assets" / "my-component.js").write_text("export default 1")
+    client = client_for(dist, tmp_path)
+
+    assert client.get("/assets/index-BQ3f_x9a.js").headers["cache-control"] == static_service.IMMUTABLE_CACHE_CONTROL
+    for path in ("/", "/robots.txt", "/assets/my-component.js"):
+        assert client.get(path).headers["cache-control"] == "no-cache"
+
+
+def test_if_none_match(dist, tmp_path):
+    client = client_for(dist, tmp_path)
+    etag = client.get("/robots.txt").headers["etag"]
+
+    assert client.get("/robots.txt", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/robots.txt", headers={"If-None-Match": f'"other", {etag}'}).status_code == 304
+    assert client.get("/robots.txt", headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get("/robots.txt", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    # Proxies that re-compress a response weaken its ETag, If-None-Match uses weak comparison
+    assert client.get("/robots.txt", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+
+def test_if_none_match_is_per_encoding(dist, tmp_path):
+    client = client_for(dist, tmp_path)
+    gzip_etag = client.get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+    not_modified = client.get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == gzip_etag
+
+    identity = client.get("/assets/index-BQ3f_x9a.js", headers={"Accept-Encoding": "identity", "If-None-Match": gzip_etag})
+    assert identity.status_code == 200
+    assert identity.content == BUNDLE
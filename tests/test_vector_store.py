@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from vector_store import NumpyVectorStore, VectorStore
+
+
+def test_incomplete_backend_fails_on_creation():
+    class QueryOnlyStore(VectorStore):
+        def query(self, query, library_ids, k):
+            return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+    with pytest.raises(TypeError):
+        QueryOnlyStore()
+
+
+class FixedEmbeddings:
+    """Embedding function returning preset vectors per text."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __call__(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+def make_chunks(library_id, count):
+    ids = [f"lib_{library_id}_chunk_{i}" for i in range(count)]
+    metadatas = [{"library_id": library_id, "chunk_index": i} for i in range(count)]
+    return ids, [f"doc {library_id}/{i}" for i in range(count)], metadatas
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_blocked_query_matches_full_scan(tmp_path, monkeypatch, dtype):
+    rng = np.random.default_rng(0)
+    query_vector = rng.normal(size=8).astype(np.float32)
+    store = NumpyVectorStore(str(tmp_path), FixedEmbeddings({"q": query_vector}), dtype=dtype)
+
+    embeddings = {}
+    for library_id, count in ((1, 37), (2, 50)):
+        ids, documents, metadatas = make_chunks(library_id, count)
+        embeddings[library_id] = rng.normal(size=(count, 8)).astype(np.float32)
+        store.add(ids, documents, metadatas, embeddings=embeddings[library_id])
+
+    full = store.query("q", [1, 2], 5)
+    monkeypatch.setattr("vector_store.QUERY_BLOCK_ROWS", 4)
+    blocked = store.query("q", [1, 2], 5)
+
+    assert blocked["ids"] == full["ids"]
+    assert blocked["distances"] == pytest.approx(full["distances"])
+    assert len(full["ids"]) == 5 and full["distances"] == sorted(full["distances"])
+
+
+def _reindex_worker(path, library_id, seed):
+    rng = np.random.default_rng(seed)
+    store = NumpyVectorStore(path, None)
+    for _ in range(5):
+        ids, documents, metadatas = make_chunks(library_id, 20)
+        store.delete_library(library_id)
+        store.add(ids, documents, metadatas, embeddings=rng.normal(size=(20, 8)).astype(np.float32))
+
+
+def test_concurrent_reindex_from_processes_leaves_one_version(tmp_path):
+    import multiprocessing
+
+    processes = [multiprocessing.Process(target=_reindex_worker, args=(str(tmp_path), 1, seed)) for seed in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    assert len(list(tmp_path.glob("lib_1.*.npy"))) == 1
+    assert len(NumpyVectorStore(str(tmp_path), None).get([f"lib_1_chunk_{i}" for i in range(20)])) == 20
+
+
+def test_load_retries_when_matrix_replaced_by_another_writer(tmp_path, monkeypatch):
+    import vector_store
+
+    ids, documents, metadatas = make_chunks(1, 3)
+    writer = NumpyVectorStore(str(tmp_path), None)
+    writer.add(ids, documents, metadatas, embeddings=np.eye(3, 8, dtype=np.float32))
+
+    # Another worker re-indexes between this reader parsing the JSON and mapping the matrix
+    real_load = np.load
+    replaced = []
+
+    def racing_load(*args, **kwargs):
+        if not replaced:
+            replaced.append(True)
+            writer.add(ids, ["new"] * 3, metadatas, embeddings=np.eye(3, 8, dtype=np.float32))
+        return real_load(*args, **kwargs)
+
+    monkeypatch.setattr(vector_store.np, "load", racing_load)
+    reader = NumpyVectorStore(str(tmp_path), None)
+    assert reader.get(ids) == ["new"] * 3
@@ -0,0 +1,368 @@
+import json
+import os
+import re
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    # Unix only: serializes writers across uvicorn workers. Elsewhere only threads are serialized.
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# --- Configuration ---
+CHROMA_BATCH_SIZE = 1000 # Rows per collection.get/upsert call, keeps requests under Chroma's max batch size
+QUERY_BLOCK_ROWS = 65536 # Rows scored per step, bounds the float32 working set regardless of library size
+LOAD_RETRIES = 3 # A concurrent write can delete the matrix between reading the JSON and mapping it
+CHUNK_ID_RE = re.compile(r"^lib_(\d+)_chunk_(\d+)$")
+
+
+@contextmanager
+def library_lock(path: str, library_id: int, thread_lock: threading.Lock):
+    """Exclusive per-library write lock on lib_{id}.lock in path, held across threads and processes."""
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(path, f"lib_{library_id}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class VectorStore(ABC):
+    """
+    Storage backend for library chunks. Chunk IDs follow the lib_{library_id}_chunk_{index}
+    convention and every chunk's metadata carries library_id and chunk_index.
+
+    query() returns a dict of parallel lists: ids, documents, metadatas and distances
+    (cosine distance, lower is closer).
+    """
+
+    @abstractmethod
+    def add(self, ids: list[str], documents: list[str], metadatas: list[dict], embeddings=None):
+        """Adds or replaces chunks. Embeddings are computed if not provided."""
+        ...
+
+    @abstractmethod
+    def delete_library(self, library_id: int):
+        ...
+
+    @abstractmethod
+    def query(self, query: str, library_ids: list[int], k: int) -> dict:
+        ...
+
+    @abstractmethod
+    def get(self, ids: list[str]) -> list[str]:
+        """Returns the documents for the given chunk IDs, skipping IDs that don't exist."""
+        ...
+
+    @abstractmethod
+    def dump(self) -> tuple[list[str], list[str], list[dict], np.ndarray]:
+        """Returns every stored chunk as (ids, documents, metadatas, float32 embedding matrix)."""
+        ...
+
+
+class ChromaVectorStore(VectorStore):
+    """Single global ChromaDB collection (HNSW), filtered by library_id metadata."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def add(self, ids, documents, metadatas, embeddings=None):
+        for start in range(0, len(ids), CHROMA_BATCH_SIZE):
+            end = start + CHROMA_BATCH_SIZE
+            self.collection.upsert(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end],
+                embeddings=None if embeddings is None else np.asarray(embeddings[start:end], dtype=np.float32).tolist(),
+            )
+
+    def delete_library(self, library_id):
+        self.collection.delete(where={"library_id": library_id})
+
+    def query(self, query, library_ids, k):
+        results = self.collection.query(
+            query_texts=[query],
+            n_results=k,
+            where={"library_id": {"$in": library_ids}},
+            include=['documents', 'metadatas', 'distances']
+        )
+        return {
+            "ids": results.get('ids', [[]])[0],
+            "documents": results.get('documents', [[]])[0],
+            "metadatas": results.get('metadatas', [[]])[0],
+            "distances": results.get('distances', [[]])[0],
+        }
+
+    def get(self, ids):
+        results = self.collection.get(ids=ids, include=['documents'])
+        return results.get('documents', [])
+
+    def dump(self):
+        ids, documents, metadatas, embeddings = [], [], [], []
+        offset = 0
+        while True:
+            batch = self.collection.get(
+                include=["documents", "metadatas", "embeddings"],
+                limit=CHROMA_BATCH_SIZE,
+                offset=offset,
+            )
+            batch_ids = batch.get("ids") or []
+            if not batch_ids:
+                break
+            ids.extend(batch_ids)
+            documents.extend(batch["documents"])
+            metadatas.extend(batch["metadatas"])
+            embeddings.extend(batch["embeddings"])
+            offset += len(batch_ids)
+        return ids, documents, metadatas, np.asarray(embeddings, dtype=np.float32)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    One embedding matrix per library, stored as a memory-mapped .npy file in float16 or
+    int8 (per-row scale). Embeddings are L2-normalized on write, so a query is a blocked
+    matrix product over only the selected libraries with a running top-k.
+
+    Files per library in `path`:
+      lib_{id}.json                 chunk ids, documents, metadatas and the current version
+      lib_{id}.{version}.npy        embedding matrix
+      lib_{id}.{version}.scales.npy per-row scales (int8 only)
+      lib_{id}.lock                 flock'ed by writers so workers don't interleave updates
+    The JSON is replaced atomically last, so readers never see a half-written library.
+    """
+
+    def __init__(self, path: str, embedding_function, dtype: str = "float16"):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported vector index dtype: {dtype}")
+        self.path = path
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self.cache = {} # library_id -> (json file signature, loaded library)
+        self.write_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    # --- Files ---
+
+    def _meta_path(self, library_id: int) -> str:
+        return os.path.join(self.path, f"lib_{library_id}.json")
+
+    def _matrix_path(self, library_id: int, version: str, suffix: str = "npy") -> str:
+        return os.path.join(self.path, f"lib_{library_id}.{version}.{suffix}")
+
+    def _library_lock(self, library_id: int):
+        return library_lock(self.path, library_id, self.write_lock)
+
+    def _library_ids(self) -> list[int]:
+        ids = []
+        for name in os.listdir(self.path):
+            match = re.match(r"^lib_(\d+)\.json$", name)
+            if match:
+                ids.append(int(match.group(1)))
+        return sorted(ids)
+
+    def _load(self, library_id: int) -> dict | None:
+        """Loads (or returns the cached) library; matrices are memory-mapped, not read."""
+        meta_path = self._meta_path(library_id)
+        for attempt in range(LOAD_RETRIES):
+            try:
+                stat = os.stat(meta_path)
+            except FileNotFoundError:
+                self.cache.pop(library_id, None)
+                return None
+
+            # os.replace gives the JSON a new inode, so this also catches writes from other workers
+            signature = (stat.st_ino, stat.st_mtime_ns)
+            cached = self.cache.get(library_id)
+            if cached and cached[0] == signature:
+                return cached[1]
+
+            try:
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                version = meta["version"]
+                library = {
+                    "ids": meta["ids"],
+                    "documents": meta["documents"],
+                    "metadatas": meta["metadatas"],
+                    "positions": {chunk_id: i for i, chunk_id in enumerate(meta["ids"])},
+                    "matrix": np.load(self._matrix_path(library_id, version), mmap_mode="r"),
+                    "scales": None,
+                }
+                if meta["dtype"] == "int8":
+                    library["scales"] = np.load(self._matrix_path(library_id, version, "scales.npy"), mmap_mode="r")
+            except FileNotFoundError:
+                # Replaced (or deleted) by another writer since the stat, re-read the new JSON
+                if attempt == LOAD_RETRIES - 1:
+                    raise
+                continue
+
+            self.cache[library_id] = (signature, library)
+            return library
+
+    def _dequantize(self, library: dict) -> np.ndarray:
+        matrix = np.asarray(library["matrix"], dtype=np.float32)
+        if library["scales"] is not None:
+            matrix = matrix * library["scales"][:, None]
+        return matrix
+
+    def _write(self, library_id: int, ids: list[str], documents: list[str], metadatas: list[dict], embeddings: np.ndarray):
+        old_meta = None
+        if os.path.exists(self._meta_path(library_id)):
+            with open(self._meta_path(library_id), "r") as f:
+                old_meta = json.load(f)
+
+        version = uuid.uuid4().hex[:12]
+        if self.dtype == "int8":
+            scales = np.abs(embeddings).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            matrix = np.round(embeddings / scales[:, None]).astype(np.int8)
+            np.save(self._matrix_path(library_id, version, "scales.npy"), scales.astype(np.float32))
+        else:
+            matrix = embeddings.astype(np.float16)
+        np.save(self._matrix_path(library_id, version), matrix)
+
+        tmp_path = self._meta_path(library_id) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": version, "dtype": self.dtype, "ids": ids, "documents": documents, "metadatas": metadatas}, f)
+        os.replace(tmp_path, self._meta_path(library_id))
+
+        if old_meta:
+            self._remove_matrices(library_id, old_meta["version"])
+
+    def _remove_matrices(self, library_id: int, version: str):
+        for suffix in ("npy", "scales.npy"):
+            try:
+                os.remove(self._matrix_path(library_id, version, suffix))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+    # --- VectorStore ---
+
+    def add(self, ids, documents, metadatas, embeddings=None):
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        embeddings = self._normalize(embeddings)
+
+        # Group rows by library, each library file is rewritten as a whole
+        by_library = {}
+        for i, metadata in enumerate(metadatas):
+            by_library.setdefault(metadata["library_id"], []).append(i)
+
+        for library_id, rows in by_library.items():
+            with self._library_lock(library_id):
+                merged = {}
+                existing = self._load(library_id)
+                if existing:
+                    existing_matrix = self._dequantize(existing)
+                    for i, chunk_id in enumerate(existing["ids"]):
+                        merged[chunk_id] = (existing["documents"][i], existing["metadatas"][i], existing_matrix[i])
+                for i in rows:
+                    merged[ids[i]] = (documents[i], metadatas[i], embeddings[i])
+
+                ordered = sorted(merged.items(), key=lambda item: item[1][1].get("chunk_index", 0))
+                self._write(
+                    library_id,
+                    [chunk_id for chunk_id, _ in ordered],
+                    [document for _, (document, _, _) in ordered],
+                    [metadata for _, (_, metadata, _) in ordered],
+                    np.stack([embedding for _, (_, _, embedding) in ordered]),
+                )
+
+    def delete_library(self, library_id):
+        with self._library_lock(library_id):
+            meta_path = self._meta_path(library_id)
+            if not os.path.exists(meta_path):
+                return
+            with open(meta_path, "r") as f:
+                version = json.load(f)["version"]
+            os.remove(meta_path)
+            self._remove_matrices(library_id, version)
+            self.cache.pop(library_id, None)
+
+    def query(self, query, library_ids, k):
+        query_embedding = self._normalize(self.embedding_function([query]))[0]
+
+        # Running top-k across all blocks: parallel arrays of score, library index and row
+        best_scores = np.empty(0, dtype=np.float32)
+        best_libraries = np.empty(0, dtype=np.int64)
+        best_rows = np.empty(0, dtype=np.int64)
+
+        libraries = []
+        for library_id in library_ids:
+            library = self._load(library_id)
+            if not library or not library["ids"]:
+                continue
+            library_index = len(libraries)
+            libraries.append(library)
+
+            matrix = library["matrix"]
+            for start in range(0, len(matrix), QUERY_BLOCK_ROWS):
+                # Only one block of the memory-mapped matrix is converted to float32 at a time
+                block_scores = matrix[start:start + QUERY_BLOCK_ROWS].astype(np.float32) @ query_embedding
+                if library["scales"] is not None:
+                    block_scores *= library["scales"][start:start + QUERY_BLOCK_ROWS]
+
+                block_rows = np.arange(start, start + len(block_scores))
+                if len(block_scores) > k:
+                    keep = np.argpartition(-block_scores, k - 1)[:k]
+                    block_scores, block_rows = block_scores[keep], block_rows[keep]
+
+                best_scores = np.concatenate([best_scores, block_scores])
+                best_libraries = np.concatenate([best_libraries, np.full(len(block_scores), library_index)])
+                best_rows = np.concatenate([best_rows, block_rows])
+                if len(best_scores) > k:
+                    keep = np.argpartition(-best_scores, k - 1)[:k]
+                    best_scores, best_libraries, best_rows = best_scores[keep], best_libraries[keep], best_rows[keep]
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for position in np.argsort(-best_scores):
+            library = libraries[best_libraries[position]]
+            row = best_rows[position]
+            results["ids"].append(library["ids"][row])
+            results["documents"].append(library["documents"][row])
+            results["metadatas"].append(library["metadatas"][row])
+            results["distances"].append(float(1.0 - best_scores[position]))
+        return results
+
+    def get(self, ids):
+        documents = []
+        for chunk_id in ids:
+            match = CHUNK_ID_RE.match(chunk_id)
+            if not match:
+                continue
+            library = self._load(int(match.group(1)))
+            if library and chunk_id in library["positions"]:
+                documents.append(library["documents"][library["positions"][chunk_id]])
+        return documents
+
+    def dump(self):
+        ids, documents, metadatas, matrices = [], [], [], []
+        for library_id in self._library_ids():
+            library = self._load(library_id)
+            if not library:
+                continue
+            ids.extend(library["ids"])
+            documents.extend(library["documents"])
+            metadatas.extend(library["metadatas"])
+            matrices.append(self._dequantize(library))
+        if not matrices:
+            return ids, documents, metadatas, np.zeros((0, 0), dtype=np.float32)
+        return ids, documents, metadatas, np.concatenate(matrices)